@@ -1,61 +1,234 @@
 import numpy
-from PythonQt.CRIMSON import ArrayDataType
+from collections import OrderedDict
+from PythonQt.CRIMSON import ArrayDataType, Utils
 from PythonQt.QtCore import QByteArray
 
+
+def _getOwningArray(data):
+    # Follow the chain of views to the array owning the memory
+    while isinstance(data.base, numpy.ndarray):
+        data = data.base
+    return data
+
+
+# {storage data type: (exported data type, ArrayDataType)}. The C++ code only supports Int and Double arrays,
+# so the reduced-precision data is converted to float64 each time it is exported
+_exportDataTypes = {
+    numpy.int32: (numpy.dtype(numpy.int32), ArrayDataType.Int),
+    numpy.float64: (numpy.dtype(numpy.float64), ArrayDataType.Double),
+    numpy.float32: (numpy.dtype(numpy.float64), ArrayDataType.Double),
+    numpy.float16: (numpy.dtype(numpy.float64), ArrayDataType.Double),
+}
+_allowedDataTypes = frozenset(_exportDataTypes)
+
+
+class _ArrayTable(OrderedDict):
+    '''
+    An OrderedDict which keeps the list of its keys for constant-time access by index.
+    The list is rebuilt on the first access after a key has been added or removed.
+    '''
+    def __init__(self, *args, **kwargs):
+        self._keys = None
+        OrderedDict.__init__(self, *args, **kwargs)
+
+    def __setitem__(self, key, value, *args):
+        if key not in self:
+            self._keys = None
+        OrderedDict.__setitem__(self, key, value, *args)
+
+    def __delitem__(self, key, *args):
+        self._keys = None
+        OrderedDict.__delitem__(self, key, *args)
+
+    def clear(self):
+        self._keys = None
+        OrderedDict.clear(self)
+
+    def keyAt(self, i):
+        if self._keys is None:
+            self._keys = list(self)
+        return self._keys[i]
+
+
 class SolutionStorage(object):
     '''
     SolutionStorage class is used to pass the loaded solution data to the C++ code.
-    The arrays data member is a dict mapping name of the data array, e.g. 'velocity' or 'pressure',
-    to the  instance of SolutionStorage.ArrayInfo class.
+    The arrays data member is an ordered dict mapping name of the data array, e.g. 'velocity' or 'pressure',
+    to the  instance of SolutionStorage.ArrayInfo class. The arrays are indexed in the order they were added.
+    If a plain dict is assigned to arrays, the arrays are ordered by name. Note that a dict or an OrderedDict
+    assigned to arrays is copied, so the arrays should then be added or removed through the arrays data member,
+    not the assigned dict.
     SolutionStorage.ArrayInfo contains the data itself in form of a 2D numpy.ndarray
-    and the names of components for multi-component arrays.
-    Allowed data types for the data are numpy.int32 and numpy.float64.
+    (or a lazy source of the data, see SolutionStorage.ArrayInfo) and the names of components for multi-component arrays.
+    Allowed data types for the data are numpy.int32 and numpy.float64, as well as numpy.float32 and numpy.float16
+    to reduce the memory used by the stored solution. The reduced-precision data is converted to the data type
+    expected by the C++ code (see getArrayDataType()) only when it is exported.
     '''
 
     class ArrayInfo(object):
         '''
         A convenience class for storing the solution name (string) and data (numpy.ndarray).
+        Instead of the data, a lazy source can be provided, i.e. an object with 'shape' and 'dtype' attributes
+        and a 'load()' method returning the numpy.ndarray, e.g. PhastaSolverIO.PhastaFieldSource.
+        The source is loaded on the first access to the data.
         '''
         def __init__(self, data, componentNames = None):
-            assert(isinstance(data, numpy.ndarray))
+            assert(isinstance(data, numpy.ndarray) or hasattr(data, 'load'))
             assert(len(data.shape) <= 2)
-            assert(data.dtype.type is numpy.float64 or data.dtype.type is numpy.int32)
-            self.data = data
+            assert(numpy.dtype(data.dtype).type in _allowedDataTypes)
+            if isinstance(data, numpy.ndarray):
+                self._data, self._source = data, None
+            else:
+                self._data, self._source = None, data
             self.componentNames = componentNames if componentNames is not None else []
 
+        @property
+        def data(self):
+            if self._data is None:
+                self._data = self._source.load()
+                self._source = None
+            return self._data
+
+        @data.setter
+        def data(self, data):
+            self._data, self._source = data, None
+
+        @property
+        def shape(self):
+            return self._data.shape if self._data is not None else self._source.shape
+
+        @property
+        def dtype(self):
+            return self._data.dtype if self._data is not None else numpy.dtype(self._source.dtype)
+
+        def isLoaded(self):
+            return self._data is not None
+
+        def getContiguousData(self):
+            '''
+            Get the data as a C-contiguous array in native byte order, i.e. in the memory layout expected by the C++ code.
+            Non-contiguous data (e.g. a transposed view) is copied once and the copy replaces the data,
+            so that the original array can be released.
+            '''
+            if not self.data.flags['C_CONTIGUOUS'] or not self.data.dtype.isnative:
+                self.data = numpy.ascontiguousarray(self.data, dtype=self.data.dtype.newbyteorder('='))
+            return self.data
+
+        def getMemoryUsage(self):
+            '''
+            :return: the number of bytes of memory kept alive by the data. If the data is a view of a larger array,
+            e.g. a field of a multi-component data block, the size of the whole array is reported.
+            Memory-mapped data and the data not loaded yet are not counted.
+            '''
+            if not self.isLoaded():
+                return 0
+            owningArray = _getOwningArray(self.data)
+            if isinstance(owningArray, numpy.memmap):
+                return 0
+            return owningArray.nbytes
+
     def __init__(self, arrays=None):
         self.arrays = {} if arrays is None else arrays
-        self._buffers = {}
+
+    @property
+    def arrays(self):
+        return self._arrays
+
+    @arrays.setter
+    def arrays(self, arrays):
+        # The arrays are copied into an _ArrayTable (unless it is one already) to index them in constant time
+        if isinstance(arrays, _ArrayTable):
+            self._arrays = arrays
+        elif isinstance(arrays, OrderedDict):
+            self._arrays = _ArrayTable(arrays)
+        else:
+            self._arrays = _ArrayTable(sorted(arrays.iteritems()))
+
+    def _getArrayInfo(self, i):
+        return self._arrays[self._arrays.keyAt(i)]
 
     def getNArrays(self):
         return len(self.arrays)
 
     def getArrayName(self, i):
-        return self.arrays.items()[i][0]
+        return self._arrays.keyAt(i)
 
     def getArrayNComponents(self, i):
-        shape = self.arrays.items()[i][1].data.shape
+        shape = self._getArrayInfo(i).shape
         return shape[1] if len(shape) > 1 else 1
 
     def getComponentNames(self, i):
-        return self.arrays.items()[i][1].componentNames
+        return self._getArrayInfo(i).componentNames
 
     def getArrayNTuples(self, i):
-        return self.arrays.items()[i][1].data.shape[0]
+        return self._getArrayInfo(i).shape[0]
 
     def getArrayDataType(self, i):
-        return ArrayDataType.Double if self.arrays.items()[i][1].data.dtype.type is numpy.float64 else ArrayDataType.Int
+        return _exportDataTypes[self._getArrayInfo(i).dtype.type][1]
+
+    def _loadArrayInfo(self, i):
+        # Load the lazy source of the array for the C++ code. If the source can no longer be read
+        # (e.g. its file has changed since the solution was loaded), the error is logged and the array is replaced
+        # by NaNs (or zeros for integer data), so that the error does not propagate to the C++ code
+        arrayInfo = self._getArrayInfo(i)
+        if not arrayInfo.isLoaded():
+            try:
+                arrayInfo.data
+            except (IOError, OSError) as e:
+                Utils.logError('Failed to load solution array {0}: {1}'.format(self.getArrayName(i), e))
+                arrayInfo.data = numpy.full(arrayInfo.shape, numpy.nan if arrayInfo.dtype.kind == 'f' else 0,
+                                            dtype=arrayInfo.dtype)
+        return arrayInfo
+
+    def getArrayBuffer(self, i):
+        '''
+        Get a read-only buffer over the array data without copying it (unless the data is not contiguous,
+        see ArrayInfo.getContiguousData()). The buffer is valid as long as the array is stored in the storage.
+        The reduced-precision data not supported by the C++ code is converted to a temporary array,
+        which is released together with the buffer.
+        If the data of a lazy source cannot be read, the error is logged and the array is filled with NaNs
+        (or zeros for integer data).
+        '''
+        data = self._loadArrayInfo(i).getContiguousData()
+        exportDataType = _exportDataTypes[data.dtype.type][0]
+        if data.dtype != exportDataType:
+            data = data.astype(exportDataType)
+        return numpy.getbuffer(data)
 
     def getArrayData(self, i):
-        name = self.getArrayName(i)
-        if name not in self._buffers:
-            data =  self.arrays.items()[i][1].data
-            shape = data.shape
-            buf = numpy.getbuffer(data if len(shape) == 1 else data.reshape((shape[0] * shape[1])))
-            ba = QByteArray()
-            ba.reserve(len(buf))
-            ba.append(str(buf), len(buf))
-            self._buffers[name] = ba
-
-        return self._buffers[name]
+        '''
+        Get a copy of the array data as QByteArray. The data is copied once, directly from the buffer
+        returned by getArrayBuffer(), and the QByteArray is not kept by the storage.
+        '''
+        buf = self.getArrayBuffer(i)
+        ba = QByteArray()
+        ba.reserve(len(buf))
+        ba.append(buf, len(buf))
+        return ba
 
+    def getArrayMemoryUsage(self, i):
+        '''
+        :return: the number of bytes of memory used by the array, see ArrayInfo.getMemoryUsage()
+        '''
+        return self._getArrayInfo(i).getMemoryUsage()
+
+    def loadArrays(self):
+        '''
+        Load the data of all the arrays which have lazy sources, e.g. before the files they are loaded from
+        are overwritten.
+        '''
+        for arrayInfo in self.arrays.itervalues():
+            arrayInfo.data
+
+    def getMemoryUsage(self):
+        '''
+        :return: the total number of bytes of memory used by all the arrays.
+        The memory shared by several arrays (e.g. fields of the same data block) is counted once.
+        '''
+        owningArrays = {}
+        for arrayInfo in self.arrays.itervalues():
+            if not arrayInfo.isLoaded():
+                continue
+            owningArray = _getOwningArray(arrayInfo.data)
+            owningArrays[id(owningArray)] = arrayInfo.getMemoryUsage()
+        return sum(owningArrays.itervalues())
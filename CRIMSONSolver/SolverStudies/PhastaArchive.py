@@ -0,0 +1,302 @@
+'''
+Compressed container for archiving phasta files.
+
+The archive has the same structure as a phasta file, i.e. a sequence of data blocks, each with a header line.
+The header line has the form 'name : < storedBytes > codec shuffle rawBytes : headerElements...', where
+'codec' is the compression used for the data block, 'shuffle' is the element size used for byte-shuffling
+the data before compression (1 if the data was not shuffled) and 'rawBytes' is the size of the uncompressed data.
+The data is stored in the byte order of the original file.
+'''
+import re
+import sys
+import bz2
+import zlib
+import threading
+import numpy
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaIO, PhastaRawFileReader, PhastaRawFileWriter, \
+    checkFileOpenInBinaryMode
+
+ArchiveIdentification = '# PHASTA Archive Version 1.0\n'
+
+# Matches the archive data block header lines
+_archiveHeaderRegex = re.compile(r'^(?P<name>[^\n]+?)\s*:\s*<\s*(?P<storedBytes>\d+)\s*>\s*(?P<codec>\w+)\s+'
+                                 r'(?P<shuffle>\d+)\s+(?P<rawBytes>-?\d+)\s*:(?P<tail>[ \t\d+-]*)\n?$')
+
+
+def _compress(data, codec, level):
+    if codec == 'raw':
+        return data
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    if codec == 'bz2':
+        return bz2.compress(data, max(1, level))
+    if codec == 'lzma':
+        if lzma is None:
+            raise ValueError('The lzma module is not available')
+        return lzma.compress(data, preset=level)
+    raise ValueError('Unknown compression codec {0}'.format(codec))
+
+
+def _decompress(data, codec):
+    if codec == 'raw':
+        return data
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'bz2':
+        return bz2.decompress(data)
+    if codec == 'lzma':
+        if lzma is None:
+            raise ValueError('The lzma module is not available')
+        return lzma.decompress(data)
+    raise ValueError('Unknown compression codec {0}'.format(codec))
+
+
+class PhastaArchiveWriter(object):
+    '''
+    Writer for compressed phasta archives.
+    The interface is the same as the one of PhastaRawFileWriter.
+    :param codec: the compression used for the data blocks, one of 'zlib', 'bz2', 'lzma' or 'raw' (no compression)
+    :param level: the compression level
+    :param shuffle: if True, the bytes of the data block elements are shuffled before compression,
+    i.e. all the first bytes of the elements are stored first, then all the second bytes etc.
+    This is lossless and usually improves the compression of floating-point data.
+    '''
+
+    def __init__(self, file, codec='zlib', level=6, shuffle=True):
+        checkFileOpenInBinaryMode(file, 'wb')
+        _compress('', codec, level)  # Check the codec is available
+        self.file = file
+        self.codec = codec
+        self.level = level
+        self.shuffle = shuffle
+        self.file.write(ArchiveIdentification)
+
+    def writeFileHeader(self):
+        self.writeDataBlock('byteorder magic number', numpy.array([[PhastaIO.ByteOrderMagicNumber]], numpy.int32))
+
+    def writeHeader(self, name, totalBytes, additionalHeaderData=None):
+        '''
+        This function writes a header-only data block, i.e. 'totalBytes' is expected to be 0.
+        To write a data block, use writeDataBlock() or writeRawData().
+        '''
+        self._writeBlock(name, '', 'raw', 1, totalBytes - 1, additionalHeaderData)
+
+    def writeRawData(self, name, rawData, additionalHeaderData=None, itemSize=1):
+        '''
+        Compress and write raw data represented as 1d array of numpy.byte.
+        :param itemSize: the size of the data elements in bytes, used for byte-shuffling
+        '''
+        shuffle = itemSize if self.shuffle and itemSize > 1 and rawData.shape[0] % itemSize == 0 else 1
+        if shuffle > 1:
+            data = numpy.ascontiguousarray(rawData.reshape((-1, shuffle)).transpose()).ravel()
+        else:
+            data = numpy.ascontiguousarray(rawData)
+
+        self._writeBlock(name, _compress(data, self.codec, self.level), self.codec, shuffle, rawData.shape[0],
+                         additionalHeaderData)
+
+    def writeDataBlock(self, name, arrayData, additionalHeaderData=None):
+        '''
+        Compress and write a numpy array. See PhastaRawFileWriter.writeDataBlock().
+        '''
+        assert (isinstance(arrayData, numpy.ndarray) and 0 < len(arrayData.shape) <= 2)
+
+        headerData = [arrayData.shape[1]]
+        if arrayData.shape[0] > 1:
+            headerData.append(arrayData.shape[0])
+        if additionalHeaderData is not None:
+            headerData += additionalHeaderData
+
+        rawData = numpy.frombuffer(numpy.ascontiguousarray(arrayData), dtype=numpy.byte)
+        self.writeRawData(name, rawData, headerData, arrayData.dtype.itemsize)
+
+    def _writeBlock(self, name, storedData, codec, shuffle, rawBytes, additionalHeaderData):
+        self.file.write('{0} : < {1} > {2} {3} {4} :'.format(name, len(storedData), codec, shuffle, rawBytes))
+        if additionalHeaderData is not None:
+            for headerItem in additionalHeaderData:
+                self.file.write(' ')
+                self.file.write(str(headerItem))
+        self.file.write('\n')
+        self.file.write(storedData)
+        self.file.write('\n')
+
+
+class PhastaArchiveReader(PhastaRawFileReader):
+    '''
+    Reader for compressed phasta archives.
+    The interface is the same as the one of PhastaRawFileReader, so the reader can be used with readPhastaFile().
+    The data blocks are decompressed when they are first accessed. Several data blocks can be decompressed
+    in parallel by calling prefetch().
+    '''
+
+    class ArchiveBlockDescriptor(PhastaRawFileReader.DataBlockDescriptor):
+        def __init__(self):
+            PhastaRawFileReader.DataBlockDescriptor.__init__(self)
+            self.storedBytes = 0
+            self.codec = 'raw'
+            self.shuffle = 1
+
+    def __init__(self, file, cache=None, maxWorkers=4):
+        '''
+        :param file: a file object opened in 'rb' mode
+        :param cache: see PhastaRawFileReader
+        :param maxWorkers: the maximum number of data blocks decompressed in parallel by prefetch()
+        '''
+        self.maxWorkers = maxWorkers
+        self._fileLock = threading.Lock()
+        PhastaRawFileReader.__init__(self, file, cache=cache)
+
+    def parseHeaders(self):
+        identification = self.file.readline()
+        if identification != ArchiveIdentification:
+            raise IOError('File {0} is not a phasta archive'.format(getattr(self.file, 'name', '')))
+
+        while True:
+            lineOffset = self.file.tell()
+            l = self.file.readline()
+            if not l:
+                break
+
+            parseResult = _archiveHeaderRegex.match(l)
+            if parseResult is None:
+                raise IOError('Failed to parse archive data block header at byte offset {0}: {1!r}'.format(
+                    lineOffset, l))
+
+            dataBlockDescriptor = PhastaArchiveReader.ArchiveBlockDescriptor()
+            dataBlockDescriptor.headerPosInFile = lineOffset
+            dataBlockDescriptor.posInFile = lineOffset + len(l)
+            dataBlockDescriptor.totalBytes = int(parseResult.group('rawBytes'))
+            dataBlockDescriptor.storedBytes = int(parseResult.group('storedBytes'))
+            dataBlockDescriptor.codec = parseResult.group('codec')
+            dataBlockDescriptor.shuffle = int(parseResult.group('shuffle'))
+            dataBlockDescriptor.headerElements = [int(x) for x in parseResult.group('tail').split()]
+
+            self.blockDescriptors[parseResult.group('name').strip()] = dataBlockDescriptor
+            self.file.seek(dataBlockDescriptor.posInFile + dataBlockDescriptor.storedBytes + 1)
+
+    def getRawData(self, dataBlockName):
+        '''
+        Get the decompressed raw data for the data block.
+        :param dataBlockName: name of the data block
+        :return: 1d numpy.ndarray of numpy.byte
+        '''
+        blockDescriptor = self.blockDescriptors[dataBlockName]
+
+        if blockDescriptor.totalBytes == -1:
+            raise KeyError('Block {0} has no data'.format(dataBlockName))
+
+        cacheKey = self._cacheKey + (dataBlockName,)
+        rawData = self.cache.get(cacheKey)
+        if rawData is not None:
+            return rawData
+
+        with self._fileLock:
+            self.file.seek(blockDescriptor.posInFile)
+            storedData = self.file.read(blockDescriptor.storedBytes)
+
+        data = _decompress(storedData, blockDescriptor.codec)
+        if len(data) != blockDescriptor.totalBytes:
+            raise IOError('Data block {0} has {1} bytes after decompression, expected {2}'.format(
+                dataBlockName, len(data), blockDescriptor.totalBytes))
+
+        rawData = numpy.frombuffer(data, dtype=numpy.byte)
+        if blockDescriptor.shuffle > 1:
+            rawData = numpy.ascontiguousarray(rawData.reshape((blockDescriptor.shuffle, -1)).transpose()).ravel()
+
+        self.cache.put(cacheKey, rawData, rawData.nbytes)
+        return rawData
+
+    def getDataBlockComponents(self, dataBlockName, dtype, startIndex, nComponents):
+        '''
+        See PhastaRawFileReader.getDataBlockComponents().
+        The whole data block is decompressed, as the compressed data cannot be read partially.
+        '''
+        _, _, numberOfComponents = self.getDataBlockLayout(dataBlockName, dtype)
+        if startIndex < 0 or nComponents < 0 or startIndex + nComponents > numberOfComponents:
+            raise IndexError(
+                'Components [{0}, {1}) are out of range for data block \'{2}\' with {3} components'.format(
+                    startIndex, startIndex + nComponents, dataBlockName, numberOfComponents))
+        return self.getNativeDataBlock(dataBlockName, dtype)[startIndex:(startIndex + nComponents), :]
+
+    def prefetch(self, dataBlockNames=None):
+        '''
+        Decompress the data blocks in parallel, so that subsequent access to them does not need decompression.
+        :param dataBlockNames: names of the data blocks to decompress. If None, all data blocks are decompressed
+        '''
+        if dataBlockNames is None:
+            dataBlockNames = self.blockDescriptors.keys()
+
+        dataBlockNames = [name for name in dataBlockNames if name in self.blockDescriptors and
+                          self.blockDescriptors[name].totalBytes != -1 and
+                          self.cache.peek(self._cacheKey + (name,)) is None]
+        if not dataBlockNames:
+            return
+
+        # Plain threads are used rather than a ThreadPool, as shutting down the pool adds a delay
+        # comparable to decompressing a restart file
+        pendingNames = iter(dataBlockNames)
+        pendingNamesLock = threading.Lock()
+        errors = []
+
+        def decompressPendingBlocks():
+            while True:
+                with pendingNamesLock:
+                    name = next(pendingNames, None)
+                if name is None or errors:
+                    return
+                try:
+                    self.getRawData(name)
+                except Exception:
+                    errors.append(sys.exc_info())
+
+        workers = [threading.Thread(target=decompressPendingBlocks)
+                   for _ in xrange(max(1, min(self.maxWorkers, len(dataBlockNames))))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+
+
+def archivePhastaFile(fileName, archiveFileName, codec='zlib', level=6, shuffle=True):
+    '''
+    Compress a phasta file into an archive. See PhastaArchiveWriter for the parameters.
+    '''
+    with open(fileName, 'rb') as inFile:
+        rawReader = PhastaRawFileReader(inFile, mmap=True)
+        with open(archiveFileName, 'wb') as outFile:
+            archiveWriter = PhastaArchiveWriter(outFile, codec, level, shuffle)
+            for blockName, blockDescriptor in sorted(rawReader.blockDescriptors.iteritems(),
+                                                     key=lambda item: item[1].posInFile):
+                if blockDescriptor.totalBytes == -1:
+                    archiveWriter.writeHeader(blockName, 0, blockDescriptor.headerElements)
+                else:
+                    archiveWriter.writeRawData(blockName, rawReader.getRawData(blockName),
+                                               blockDescriptor.headerElements, rawReader.getItemSize(blockName))
+
+
+def extractPhastaArchive(archiveFileName, fileName):
+    '''
+    Decompress an archive back to a phasta file.
+    '''
+    with open(archiveFileName, 'rb') as inFile:
+        archiveReader = PhastaArchiveReader(inFile, cache=None)
+        with open(fileName, 'wb') as outFile:
+            outFile.write('# PHASTA Input File Version 2.0\n')
+            rawWriter = PhastaRawFileWriter(outFile)
+            for blockName, blockDescriptor in sorted(archiveReader.blockDescriptors.iteritems(),
+                                                     key=lambda item: item[1].posInFile):
+                if blockDescriptor.totalBytes == -1:
+                    rawWriter.writeHeader(blockName, 0, blockDescriptor.headerElements)
+                else:
+                    rawWriter.writeRawData(blockName, archiveReader.getRawData(blockName),
+                                           blockDescriptor.headerElements)
+                    archiveReader.cache.discard(archiveReader._cacheKey + (blockName,))
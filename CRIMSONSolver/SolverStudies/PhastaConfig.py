@@ -8,6 +8,17 @@ class PhastaConfig(object):
             self.dataType = dataType
             self.optional = optional
 
+            # Total number of components in the data block, including the ones not covered by fields
+            self.nComponents = 0
+            for field in sorted(fields, key=lambda f: f.startIndex):
+                if field.startIndex < 0 or field.nComponents <= 0:
+                    raise ValueError('Field {0} of data block {1} has invalid component range [{2}, {3})'.format(
+                        field.name, phastaDataBlockName, field.startIndex, field.startIndex + field.nComponents))
+                if field.startIndex < self.nComponents:
+                    raise ValueError('Field {0} of data block {1} overlaps with another field'.format(
+                        field.name, phastaDataBlockName))
+                self.nComponents = field.startIndex + field.nComponents
+
     class Field(object):
         def __init__(self, name, startIndex, nComponents):
             self.name = name
@@ -17,12 +28,17 @@ class PhastaConfig(object):
     def __init__(self, arrayDescriptors):
         self.arrayDescriptors = arrayDescriptors
 
-    def findDescriptorAndField(self, fieldName):
-        for arrayDesc in self.arrayDescriptors:
+        self._fieldIndex = {}
+        for arrayDesc in arrayDescriptors:
             for field in arrayDesc.fields:
-                if field.name == fieldName:
-                    return arrayDesc, field
-        return None, None
+                if field.name is None:
+                    continue
+                if field.name in self._fieldIndex:
+                    raise ValueError('Field {0} is defined for more than one data block'.format(field.name))
+                self._fieldIndex[field.name] = (arrayDesc, field)
+
+    def findDescriptorAndField(self, fieldName):
+        return self._fieldIndex.get(fieldName, (None, None))
 
 
 restartConfig = PhastaConfig([
@@ -64,3 +80,17 @@ ybarConfig = PhastaConfig([
         ]),
 ])
 
+# All the components of the 'ybar' data block as a single field, e.g. for the statistics over ybar.* files
+ybarAllComponentsConfig = PhastaConfig([
+    PhastaConfig.ArrayDescriptor('ybar', numpy.float64, False,
+        [
+            PhastaConfig.Field('ybar components', 0, 5),
+        ]),
+])
+
+geombcConfig = PhastaConfig([
+    PhastaConfig.ArrayDescriptor('co-ordinates', numpy.float64, False,
+        [
+            PhastaConfig.Field('coordinates', 0, 3),
+        ]),
+])
@@ -0,0 +1,89 @@
+import numpy
+
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader
+
+
+class GeombcData(object):
+    '''
+    Mesh data read from the geombc.dat.<partition> file written by the presolver.
+    All the arrays are indexed by (node or element) index first. The arrays read from the file are
+    transposed views of the file contents, i.e. if the file was memory-mapped, no data is read until accessed.
+    The node indices in the connectivity arrays are 1-based, as written by the presolver.
+    '''
+    def __init__(self):
+        #: numpy.ndarray of shape (nNodes, nSpaceDimensions)
+        self.coordinates = None
+        #: {'topology name', e.g. 'linear tetrahedron': numpy.ndarray of shape (nElements, nNodesPerElement)}
+        self.interiorConnectivity = {}
+        #: {'topology name': numpy.ndarray of shape (nBoundaryElements, nNodesPerElement)}
+        self.boundaryConnectivity = {}
+        #: {'topology name': numpy.ndarray of shape (nBoundaryElements,)} - the face identifier of each boundary element
+        self.boundaryFaceIds = {}
+        #: 0-based local-to-global node map for partitioned meshes, None if the file has no 'mode number map'
+        self.localToGlobalMap = None
+
+
+def _readComponentBlock(rawReader, dataBlockName, dtype):
+    # The geombc headers contain element block information after the number of elements, so the number of components
+    # is computed from the data block size rather than checked against the header as PhastaRawFileReader does.
+    blockDescriptor = rawReader.getBlockDescriptor(dataBlockName)
+    element_dtype = numpy.dtype(dtype).newbyteorder(rawReader.byteOrderCode)
+    numberOfElements = blockDescriptor.headerElements[0]
+    numberOfComponents, remainder = divmod(blockDescriptor.totalBytes, element_dtype.itemsize * numberOfElements) \
+        if numberOfElements > 0 else (0, 0)
+    if remainder != 0:
+        raise RuntimeError(
+            'Data block \'{0}\' cannot be interpreted as an array of components, '
+            'each with number of elements {1} of type {2}'.format(dataBlockName, numberOfElements, dtype))
+
+    dataBlock = numpy.frombuffer(rawReader.getRawData(dataBlockName), dtype=element_dtype,
+                                 count=numberOfComponents * numberOfElements)
+    if not dataBlock.dtype.isnative:
+        dataBlock = dataBlock.byteswap().view(dataBlock.dtype.newbyteorder())
+    return dataBlock.reshape((numberOfComponents, numberOfElements)).transpose()
+
+
+def readGeombc(fileName, mmap=True):
+    '''
+    Read the mesh data from a geombc file.
+    :param fileName: name of the geombc file, e.g. 'geombc.dat.1'
+    :param mmap: passed to PhastaRawFileReader. If True, the arrays are backed by the memory-mapped file
+    :return: instance of GeombcData
+    '''
+    result = GeombcData()
+
+    with open(fileName, 'rb') as inFile:
+        rawReader = PhastaRawFileReader(inFile, mmap=mmap)
+
+        for blockName, blockDescriptor in rawReader.blockDescriptors.iteritems():
+            if blockDescriptor.totalBytes <= 0:
+                continue
+
+            if blockName == 'co-ordinates':
+                result.coordinates = _readComponentBlock(rawReader, blockName, numpy.float64)
+            elif blockName.startswith('connectivity interior '):
+                result.interiorConnectivity[blockName[len('connectivity interior '):]] = \
+                    _readComponentBlock(rawReader, blockName, numpy.int32)
+            elif blockName.startswith('connectivity boundary '):
+                result.boundaryConnectivity[blockName[len('connectivity boundary '):]] = \
+                    _readComponentBlock(rawReader, blockName, numpy.int32)
+            elif blockName.startswith('nbc codes '):
+                # The second column of the boundary element codes is the surface (face) identifier
+                nbcCodes = _readComponentBlock(rawReader, blockName, numpy.int32)
+                if nbcCodes.shape[1] > 1:
+                    result.boundaryFaceIds[blockName[len('nbc codes '):]] = nbcCodes[:, 1]
+            elif blockName == 'mode number map':
+                result.localToGlobalMap = _readComponentBlock(rawReader, blockName, numpy.int32)[:, 0] - 1
+
+    return result
+
+
+def readLocalToGlobalMap(fileName):
+    '''
+    Read the 0-based local-to-global node map of a mesh partition from its geombc file,
+    e.g. to be used with PhastaPartitions.mergePhastaPartitions().
+    '''
+    localToGlobalMap = readGeombc(fileName).localToGlobalMap
+    if localToGlobalMap is None:
+        raise KeyError('Phasta file {0} does not contain the \'mode number map\' data block'.format(fileName))
+    return localToGlobalMap
@@ -0,0 +1,89 @@
+import os
+import re
+import numpy
+from multiprocessing.pool import ThreadPool
+
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, readPhastaFile
+
+
+def findPartitionFiles(directory, prefix, timeStep):
+    '''
+    Find the partitions of a phasta file written by a parallel flowsolver run,
+    i.e. the files named '<prefix>.<timeStep>.<partition>'.
+    :return: a list of file names sorted by partition number
+    '''
+    fileNameRegex = re.compile(r'^{0}\.{1}\.(\d+)$'.format(re.escape(prefix), timeStep))
+
+    partitions = []
+    for fileName in os.listdir(directory):
+        match = fileNameRegex.match(fileName)
+        if match is not None:
+            partitions.append((int(match.group(1)), os.path.join(directory, fileName)))
+
+    return [fileName for _, fileName in sorted(partitions)]
+
+
+def mergePhastaPartitions(fileNames, localToGlobalMaps, config, fields, nGlobalNodes=None, maxWorkers=4,
+                          streaming=False, useIndex=False):
+    '''
+    Merge the fields from the partitions of a phasta file into global, node-indexed arrays.
+    Each partition's data is scattered to the global arrays using the partition's local-to-global node map.
+    The values of the nodes shared between partitions are taken from any of the partitions sharing them.
+    :param fileNames: the partition file names, e.g. as returned by findPartitionFiles()
+    :param localToGlobalMaps: a sequence of 1d integer numpy.ndarrays, one for each partition, mapping the
+    partition's local node index to the 0-based global node index (see PhastaGeombc.readLocalToGlobalMap())
+    :param config: configuration (instance of PhastaConfig)
+    :param fields: a sequence of field names to merge
+    :param nGlobalNodes: the total number of nodes. If None, it is computed from the local-to-global maps
+    :param maxWorkers: the maximum number of partitions read at the same time
+    :param streaming: if True, the partitions are read one after another, so that no more than one partition's
+    data is held in memory in addition to the result
+    :param useIndex: passed to PhastaRawFileReader
+    :return: a dictionary {'field name': numpy.ndarray} with arrays of shape (nComponents, nGlobalNodes)
+    '''
+    if not fileNames:
+        raise ValueError('No partitions to merge')
+    if len(fileNames) != len(localToGlobalMaps):
+        raise ValueError('Expected a local-to-global map for each of the {0} partitions, got {1}'.format(
+            len(fileNames), len(localToGlobalMaps)))
+
+    localToGlobalMaps = [numpy.asarray(nodeMap, dtype=numpy.intp) for nodeMap in localToGlobalMaps]
+    if nGlobalNodes is None:
+        nGlobalNodes = max(int(nodeMap.max()) + 1 for nodeMap in localToGlobalMaps if nodeMap.size > 0)
+
+    result = {}
+    for fieldName in fields:
+        arrayDesc, fieldDesc = config.findDescriptorAndField(fieldName)
+        if arrayDesc is None:
+            raise KeyError('Array descriptor for field {0} was not found'.format(fieldName))
+        result[fieldName] = numpy.zeros((fieldDesc.nComponents, nGlobalNodes), arrayDesc.dataType)
+
+    def mergePartition(partitionIndex):
+        fileName = fileNames[partitionIndex]
+        nodeMap = localToGlobalMaps[partitionIndex]
+
+        with open(fileName, 'rb') as inFile:
+            partitionFields = readPhastaFile(PhastaRawFileReader(inFile, useIndex=useIndex), config, fields)
+
+        for fieldName in fields:
+            if fieldName not in partitionFields:
+                raise KeyError('Field {0} not found in phasta file {1}'.format(fieldName, fileName))
+            fieldData = partitionFields[fieldName]
+            if fieldData.shape[1] != nodeMap.shape[0]:
+                raise RuntimeError(
+                    'Field {0} in partition {1} has {2} elements, but the local-to-global map has {3} nodes'.format(
+                        fieldName, fileName, fieldData.shape[1], nodeMap.shape[0]))
+            result[fieldName][:, nodeMap] = fieldData
+
+    if streaming or maxWorkers <= 1:
+        for partitionIndex in xrange(len(fileNames)):
+            mergePartition(partitionIndex)
+    else:
+        pool = ThreadPool(min(maxWorkers, len(fileNames)))
+        try:
+            pool.map(mergePartition, xrange(len(fileNames)))
+        finally:
+            pool.close()
+            pool.join()
+
+    return result
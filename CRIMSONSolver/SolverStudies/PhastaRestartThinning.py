@@ -0,0 +1,206 @@
+import os
+import re
+import shutil
+import tempfile
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, getIndexFileName, copyFileRange, \
+    replaceFile
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig
+
+
+class RetentionPolicy(object):
+    '''
+    Defines which restarts of a run are kept. A time step is kept if any of the rules selects it.
+    If no rule is set, all the time steps are kept.
+    '''
+    def __init__(self, everyNthStep=None, stepsPerCycle=None, lastCycles=None, phaseSamplesPerCycle=None,
+                 keepLatest=True):
+        '''
+        :param everyNthStep: keep the time steps divisible by this number
+        :param stepsPerCycle: the number of time steps in a cardiac cycle, required by 'lastCycles'
+        and 'phaseSamplesPerCycle'
+        :param lastCycles: keep all the time steps of this many last cycles
+        :param phaseSamplesPerCycle: keep this many time steps per cycle, the ones closest to evenly spaced phases
+        :param keepLatest: keep the latest time step, so that the run can be continued
+        '''
+        if (lastCycles is not None or phaseSamplesPerCycle is not None) and not stepsPerCycle:
+            raise ValueError('stepsPerCycle is required for the cycle-based retention rules')
+        self.everyNthStep = everyNthStep
+        self.stepsPerCycle = stepsPerCycle
+        self.lastCycles = lastCycles
+        self.phaseSamplesPerCycle = phaseSamplesPerCycle
+        self.keepLatest = keepLatest
+
+    def selectRetainedSteps(self, timeSteps):
+        '''
+        :param timeSteps: a sequence of time steps
+        :return: the set of the time steps to keep
+        '''
+        timeSteps = sorted(set(timeSteps))
+        if not timeSteps:
+            return set()
+        if self.everyNthStep is None and self.lastCycles is None and self.phaseSamplesPerCycle is None:
+            return set(timeSteps)
+
+        retained = set()
+        if self.everyNthStep is not None:
+            retained.update(step for step in timeSteps if step % self.everyNthStep == 0)
+
+        if self.lastCycles is not None:
+            firstRetainedStep = timeSteps[-1] - self.lastCycles * self.stepsPerCycle
+            retained.update(step for step in timeSteps if step > firstRetainedStep)
+
+        if self.phaseSamplesPerCycle is not None:
+            stepsByCycle = defaultdict(list)
+            for step in timeSteps:
+                stepsByCycle[step // self.stepsPerCycle].append(step)
+
+            phases = [int(round(i * float(self.stepsPerCycle) / self.phaseSamplesPerCycle))
+                      for i in xrange(self.phaseSamplesPerCycle)]
+            for cycle, cycleSteps in stepsByCycle.iteritems():
+                for phase in phases:
+                    retained.add(min(cycleSteps, key=lambda step: abs(step - cycle * self.stepsPerCycle - phase)))
+
+        if self.keepLatest:
+            retained.add(timeSteps[-1])
+
+        return retained
+
+
+class ThinningReport(object):
+    def __init__(self):
+        #: lists of file names
+        self.keptFiles = []
+        self.deletedFiles = []
+        self.rewrittenFiles = []
+        #: the number of bytes freed by deleting and rewriting the files
+        self.reclaimedBytes = 0
+
+    def __str__(self):
+        return 'Kept {0} files ({1} rewritten), deleted {2} files, reclaimed {3:.1f} MB'.format(
+            len(self.keptFiles), len(self.rewrittenFiles), len(self.deletedFiles), self.reclaimedBytes / 1e6)
+
+
+def findRestartFiles(directory, prefix='restart'):
+    '''
+    Find the files named '<prefix>.<timeStep>.<partition>' for all the partitions.
+    :return: a dictionary {timeStep: [file names]}
+    '''
+    fileNameRegex = re.compile(r'^{0}\.(\d+)\.(\d+)$'.format(re.escape(prefix)))
+
+    result = defaultdict(list)
+    for fileName in os.listdir(directory):
+        match = fileNameRegex.match(fileName)
+        if match is not None:
+            result[int(match.group(1))].append(os.path.join(directory, fileName))
+
+    return dict(result)
+
+
+def _removeIndexFile(fileName):
+    # Remove the block index of the file (see PhastaRawFileReader), if any. Returns the number of bytes freed
+    indexFileName = getIndexFileName(fileName)
+    if not os.path.exists(indexFileName):
+        return 0
+    indexFileSize = os.path.getsize(indexFileName)
+    os.remove(indexFileName)
+    return indexFileSize
+
+
+def removeDataBlocks(fileName, blockNames):
+    '''
+    Rewrite a phasta file without the given data blocks. The file is rewritten into a temporary file
+    in the same folder, which then replaces the original file. The block index of the file becomes stale
+    and is removed.
+    :return: the number of bytes removed, including the index file
+    '''
+    with open(fileName, 'rb') as inFile:
+        rawReader = PhastaRawFileReader(inFile)
+    blocks = sorted(rawReader.blockDescriptors.iteritems(), key=lambda item: item[1].posInFile)
+    blocksToRemove = [(name, d) for name, d in blocks if name in blockNames]
+    if not blocksToRemove:
+        return 0
+
+    originalSize = os.path.getsize(fileName)
+    tempFileHandle, tempFileName = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fileName)))
+    os.close(tempFileHandle)
+    try:
+        with open(fileName, 'rb') as inFile, open(tempFileName, 'wb') as tempFile:
+            # Copy everything except the removed blocks, including the comments between the blocks
+            copyPos = 0
+            for name, d in blocksToRemove:
+                copyFileRange(inFile, tempFile, copyPos, d.headerPosInFile - copyPos)
+                copyPos = d.posInFile + d.totalBytes + 1
+            copyFileRange(inFile, tempFile, copyPos, originalSize - copyPos)
+
+        shutil.copymode(fileName, tempFileName)
+        replaceFile(tempFileName, fileName)
+    except:
+        if os.path.exists(tempFileName):
+            os.remove(tempFileName)
+        raise
+
+    return originalSize - os.path.getsize(fileName) + _removeIndexFile(fileName)
+
+
+def thinRestarts(directory, policy, dropBlocks=(), prefix='restart', maxWorkers=4, dryRun=False):
+    '''
+    Delete the restart files not retained by the policy and optionally remove data blocks from the retained ones.
+    All the partitions of a time step are kept or deleted together. The block indices of the deleted files
+    are deleted as well.
+    :param directory: the folder containing the restart files
+    :param policy: instance of RetentionPolicy
+    :param dropBlocks: names of the optional data blocks to remove from the retained files,
+    e.g. ['time derivative of solution']
+    :param prefix: the file name prefix
+    :param maxWorkers: the maximum number of files processed at the same time
+    :param dryRun: if True, the files are not changed and the report contains the files that would be deleted
+    and the space that would be reclaimed by deleting them
+    :return: instance of ThinningReport
+    '''
+    dropBlocks = set(dropBlocks)
+    for arrayDesc in restartConfig.arrayDescriptors:
+        if arrayDesc.phastaDataBlockName in dropBlocks and not arrayDesc.optional:
+            raise ValueError('Cannot remove the non-optional data block {0}'.format(arrayDesc.phastaDataBlockName))
+
+    filesByStep = findRestartFiles(directory, prefix)
+    retainedSteps = policy.selectRetainedSteps(filesByStep.keys())
+
+    report = ThinningReport()
+    for step in sorted(filesByStep.iterkeys()):
+        if step in retainedSteps:
+            report.keptFiles.extend(sorted(filesByStep[step]))
+        else:
+            report.deletedFiles.extend(sorted(filesByStep[step]))
+
+    if dryRun:
+        report.reclaimedBytes = sum(os.path.getsize(fileName) for fileName in report.deletedFiles)
+        report.reclaimedBytes += sum(os.path.getsize(getIndexFileName(fileName)) for fileName in report.deletedFiles
+                                     if os.path.exists(getIndexFileName(fileName)))
+        return report
+
+    def deleteFile(fileName):
+        fileSize = os.path.getsize(fileName)
+        os.remove(fileName)
+        return fileSize + _removeIndexFile(fileName)
+
+    def rewriteFile(fileName):
+        return removeDataBlocks(fileName, dropBlocks)
+
+    tasks = [(deleteFile, fileName) for fileName in report.deletedFiles]
+    if dropBlocks:
+        tasks += [(rewriteFile, fileName) for fileName in report.keptFiles]
+
+    pool = ThreadPool(max(1, min(maxWorkers, len(tasks))))
+    try:
+        reclaimedBytes = pool.map(lambda task: task[0](task[1]), tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    report.reclaimedBytes = sum(reclaimedBytes)
+    report.rewrittenFiles = [fileName for (function, fileName), nBytes in zip(tasks, reclaimedBytes)
+                             if function is rewriteFile and nBytes > 0]
+    return report
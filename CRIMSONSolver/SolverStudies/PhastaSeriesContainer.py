@@ -0,0 +1,179 @@
+'''
+Container packing the fields of a sequence of phasta files into a single memory-mappable file.
+
+The file starts with an identification line followed by a JSON header line, padded to 'Alignment' bytes.
+Each field is stored as a little-endian array of shape (nStepChunks, nNodes, stepChunk, nComponents), i.e. the
+steps are grouped into chunks of 'stepChunk' steps and each chunk is node-major. Reading the time history of a few
+nodes then reads nStepChunks short contiguous runs per node, while reading a single step touches one chunk.
+'''
+import json
+import numpy
+from multiprocessing.pool import ThreadPool
+
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, readPhastaFile
+from CRIMSONSolver.SolverStudies.PhastaTimeSeries import readTimeStepAndLayout
+
+ContainerIdentification = '# PHASTA Time Series Version 1.0\n'
+Alignment = 4096
+
+
+def _alignedOffset(offset):
+    return (offset + Alignment - 1) // Alignment * Alignment
+
+
+def packPhastaTimeSeries(fileNames, containerFileName, config, fields, stepChunk=16, maxWorkers=4, useIndex=False):
+    '''
+    Pack the fields from a sequence of phasta files into a time series container.
+    No more than 'stepChunk' steps are held in memory at any time.
+    :param fileNames: a sequence of phasta file names, e.g. as returned by PhastaTimeSeries.findPhastaFiles()
+    :param containerFileName: the name of the container file to write
+    :param config: configuration (instance of PhastaConfig)
+    :param fields: a sequence of field names to pack
+    :param stepChunk: the number of steps stored together for each node
+    :param maxWorkers: the maximum number of files read at the same time
+    :param useIndex: passed to PhastaRawFileReader
+    '''
+    fileNames = [x[1] if isinstance(x, tuple) else x for x in fileNames]
+    fields = list(fields)
+    if not fileNames:
+        raise ValueError('No files to pack')
+    if stepChunk < 1:
+        raise ValueError('stepChunk must be positive, got {0}'.format(stepChunk))
+
+    pool = ThreadPool(max(1, min(maxWorkers, len(fileNames))))
+    try:
+        timeStepsAndLayouts = pool.map(lambda fileName: readTimeStepAndLayout(fileName, config, fields, useIndex),
+                                       fileNames)
+
+        if all(timeStep is not None for timeStep, _, _ in timeStepsAndLayouts):
+            order = sorted(xrange(len(fileNames)), key=lambda i: timeStepsAndLayouts[i][0])
+            timeSteps = [timeStepsAndLayouts[i][0] for i in order]
+        else:
+            order = range(len(fileNames))
+            timeSteps = range(len(fileNames))
+
+        nStepChunks = (len(fileNames) + stepChunk - 1) // stepChunk
+        nNodes = None
+        fieldLayouts = []
+        for fieldName in fields:
+            layouts = set(layouts[fieldName] for _, layouts, _ in timeStepsAndLayouts)
+            if len(layouts) > 1:
+                raise RuntimeError('Field {0} has different number of elements in the files'.format(fieldName))
+            nComponents, numberOfElements, dtype = layouts.pop()
+            if nNodes is not None and numberOfElements != nNodes:
+                raise RuntimeError('Field {0} has {1} elements, expected {2}'.format(
+                    fieldName, numberOfElements, nNodes))
+            nNodes = numberOfElements
+            fieldLayouts.append((fieldName, nComponents, dtype.newbyteorder('<')))
+
+        header = {'timeSteps': timeSteps, 'nNodes': nNodes, 'stepChunk': stepChunk, 'fields': []}
+        offset = 0
+        for fieldName, nComponents, dtype in fieldLayouts:
+            header['fields'].append({'name': fieldName, 'nComponents': nComponents, 'dtype': dtype.str,
+                                     'offset': offset})
+            offset = _alignedOffset(offset + nStepChunks * nNodes * stepChunk * nComponents * dtype.itemsize)
+
+        headerLine = json.dumps(header) + '\n'
+        dataOffset = _alignedOffset(len(ContainerIdentification) + len(headerLine))
+
+        with open(containerFileName, 'wb') as outFile:
+            outFile.write(ContainerIdentification)
+            outFile.write(headerLine)
+
+            for chunkIndex in xrange(nStepChunks):
+                chunkSteps = order[chunkIndex * stepChunk:(chunkIndex + 1) * stepChunk]
+                chunks = [numpy.zeros((nNodes, stepChunk, nComponents), dtype)
+                          for _, nComponents, dtype in fieldLayouts]
+
+                def readStep(indexInChunk):
+                    with open(fileNames[chunkSteps[indexInChunk]], 'rb') as inFile:
+                        stepFields = readPhastaFile(PhastaRawFileReader(inFile, useIndex=useIndex), config, fields)
+                    for fieldIndex, (fieldName, _, _) in enumerate(fieldLayouts):
+                        chunks[fieldIndex][:, indexInChunk, :] = stepFields[fieldName].transpose()
+
+                pool.map(readStep, xrange(len(chunkSteps)))
+
+                for fieldIndex, chunk in enumerate(chunks):
+                    fieldOffset = dataOffset + header['fields'][fieldIndex]['offset']
+                    outFile.seek(fieldOffset + chunkIndex * chunk.nbytes)
+                    chunk.tofile(outFile)
+
+            # Make sure the padding after the last field is present
+            outFile.truncate(dataOffset + offset)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class PhastaSeriesContainer(object):
+    '''
+    Reader for the time series containers written by packPhastaTimeSeries().
+    The data is memory-mapped, so only the parts of the file actually accessed are read.
+    '''
+
+    def __init__(self, fileName):
+        with open(fileName, 'rb') as inFile:
+            if inFile.readline() != ContainerIdentification:
+                raise IOError('File {0} is not a phasta time series container'.format(fileName))
+            headerLine = inFile.readline()
+            header = json.loads(headerLine)
+
+        dataOffset = _alignedOffset(len(ContainerIdentification) + len(headerLine))
+
+        #: 1d numpy.ndarray of the time steps stored in the container, in increasing order
+        self.timeSteps = numpy.array(header['timeSteps'], dtype=numpy.int64)
+        self.nNodes = header['nNodes']
+        self.stepChunk = header['stepChunk']
+        self.fieldNames = [field['name'] for field in header['fields']]
+
+        nStepChunks = (len(self.timeSteps) + self.stepChunk - 1) // self.stepChunk
+        self._fields = {}
+        for field in header['fields']:
+            self._fields[field['name']] = numpy.memmap(
+                fileName, dtype=numpy.dtype(str(field['dtype'])), mode='r', offset=dataOffset + field['offset'],
+                shape=(nStepChunks, self.nNodes, self.stepChunk, field['nComponents']))
+
+    def _getFieldData(self, fieldName):
+        try:
+            return self._fields[fieldName]
+        except KeyError:
+            raise KeyError('Field {0} is not stored in the container'.format(fieldName))
+
+    def getStepIndex(self, timeStep):
+        '''
+        :return: the index of 'timeStep' in timeSteps
+        '''
+        stepIndex = numpy.searchsorted(self.timeSteps, timeStep)
+        if stepIndex >= len(self.timeSteps) or self.timeSteps[stepIndex] != timeStep:
+            raise KeyError('Time step {0} is not stored in the container'.format(timeStep))
+        return int(stepIndex)
+
+    def probe(self, fieldName, nodes):
+        '''
+        Read the time history of a field at a set of nodes.
+        :param nodes: a sequence of 0-based node indices
+        :return: numpy.ndarray of shape (nSteps, nComponents, len(nodes))
+        '''
+        data = self._getFieldData(fieldName)
+        nodeData = data[:, numpy.asarray(nodes, dtype=numpy.intp), :, :]
+        nodeData = nodeData.transpose((0, 2, 3, 1)).reshape((-1, data.shape[3], nodeData.shape[1]))
+        return numpy.array(nodeData[:len(self.timeSteps)], dtype=data.dtype.newbyteorder('='))
+
+    def snapshot(self, fieldName, timeStep):
+        '''
+        Read a field at all the nodes for a single time step.
+        :return: numpy.ndarray of shape (nComponents, nNodes), i.e. the same as returned by readPhastaFile()
+        '''
+        data = self._getFieldData(fieldName)
+        stepIndex = self.getStepIndex(timeStep)
+        stepData = data[stepIndex // self.stepChunk, :, stepIndex % self.stepChunk, :]
+        return numpy.array(stepData.transpose(), dtype=data.dtype.newbyteorder('='), order='C')
+
+    def close(self):
+        self._fields = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,121 @@
+import os
+import threading
+import numpy
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, readPhastaFile, createPhastaFieldSources, \
+    transposeAndConvert
+
+
+class PhastaLoadResult(object):
+    '''
+    The result of loading a single phasta file with loadPhastaFiles().
+    '''
+    def __init__(self, fileName):
+        self.fileName = fileName
+        #: OrderedDict {'field name': data} in the order of the configuration, None if the file was not loaded
+        self.fields = None
+        #: the exception raised while loading the file, if any
+        self.error = None
+
+
+def _loadFields(fileName, config, eager, storageDataTypes):
+    if not eager:
+        return createPhastaFieldSources(fileName, config, storageDataTypes)
+
+    with open(fileName, 'rb') as inFile:
+        fields = readPhastaFile(PhastaRawFileReader(inFile), config)
+
+    result = OrderedDict()
+    for arrayDesc in config.arrayDescriptors:
+        for field in arrayDesc.fields:
+            if field.name not in fields:
+                continue
+            # Transposed and converted by the worker, so the stored arrays are contiguous and own their memory
+            result[field.name] = transposeAndConvert(fields[field.name],
+                                                     storageDataTypes.get(field.name, fields[field.name].dtype))
+    return result
+
+
+# The data types of the fields stored with reduced precision, see getReducedPrecisionDataTypes()
+reducedPrecisionDataTypes = {
+    'custom_error_indicator': numpy.float16,
+}
+
+
+def getReducedPrecisionDataTypes(configs):
+    '''
+    Get the storage data types (see loadPhastaFiles()) for loading the fields of the configurations
+    with reduced precision: the floating-point fields are stored as numpy.float32,
+    except the fields listed in reducedPrecisionDataTypes, e.g. the error indicator is stored as numpy.float16.
+    :param configs: a sequence of configurations (instances of PhastaConfig)
+    :return: a dictionary {'field name': numpy data type}
+    '''
+    result = {}
+    for config in configs:
+        for arrayDesc in config.arrayDescriptors:
+            if numpy.dtype(arrayDesc.dataType).kind != 'f':
+                continue
+            for field in arrayDesc.fields:
+                if field.name is not None:
+                    result[field.name] = reducedPrecisionDataTypes.get(field.name, numpy.float32)
+    return result
+
+
+def loadPhastaFiles(fileNames, configs, maxWorkers=4, eager=False, progressCallback=None, cancelEvent=None,
+                    storageDataTypes=None):
+    '''
+    Load the fields from several phasta files concurrently.
+    :param fileNames: a sequence of phasta file names
+    :param configs: a sequence of configurations (instances of PhastaConfig), one for each file
+    :param maxWorkers: the maximum number of files loaded at the same time
+    :param eager: if True, the fields' data is read and returned as C-contiguous numpy.ndarrays
+    of shape (nElements, nComponents).
+    Otherwise, only the headers are read and the fields are returned as PhastaSolverIO.PhastaFieldSource objects
+    :param progressCallback: if not None, called in the calling thread each time a file has been loaded as
+    progressCallback(nFilesLoaded, nFiles, nBytesLoaded, nBytes), where the numbers of bytes are the sizes of the files.
+    If the callback returns False, the loading is cancelled: the files not started yet are not loaded
+    :param cancelEvent: optional threading.Event, which cancels the loading when set, e.g. from another thread
+    :param storageDataTypes: optional dictionary {'field name': numpy data type} of the fields to be stored with
+    reduced precision, e.g. {'velocity': numpy.float32}. The data is converted once, while loading
+    :return: a list of PhastaLoadResult in the order of 'fileNames'
+    '''
+    fileNames = list(fileNames)
+    configs = list(configs)
+    if len(fileNames) != len(configs):
+        raise ValueError('Expected a configuration for each of the {0} files, got {1}'.format(
+            len(fileNames), len(configs)))
+
+    storageDataTypes = storageDataTypes or {}
+    results = [PhastaLoadResult(fileName) for fileName in fileNames]
+    if not fileNames:
+        return results
+
+    fileSizes = [os.path.getsize(fileName) if os.path.exists(fileName) else 0 for fileName in fileNames]
+    cancelled = cancelEvent if cancelEvent is not None else threading.Event()
+
+    def loadFile(fileIndex):
+        if not cancelled.is_set():
+            result = results[fileIndex]
+            try:
+                result.fields = _loadFields(fileNames[fileIndex], configs[fileIndex], eager, storageDataTypes)
+            except Exception as e:
+                result.error = e
+        return fileIndex
+
+    pool = ThreadPool(max(1, min(maxWorkers, len(fileNames))))
+    try:
+        nFilesLoaded = 0
+        nBytesLoaded = 0
+        for fileIndex in pool.imap_unordered(loadFile, xrange(len(fileNames))):
+            nFilesLoaded += 1
+            nBytesLoaded += fileSizes[fileIndex]
+            if progressCallback is not None and not cancelled.is_set():
+                if progressCallback(nFilesLoaded, len(fileNames), nBytesLoaded, sum(fileSizes)) is False:
+                    cancelled.set()
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
@@ -1,42 +1,281 @@
 import numpy
-import parse
+import re
 import sys
+import os
+import json
+import shutil
+import tempfile
+import threading
 import operator
+from collections import OrderedDict
 
 
 class PhastaIO:
     ByteOrderMagicNumber = 362436
 
 
-def _checkFileOpenInBinaryMode(file, mode):
+# Matches the data block header lines, i.e. 'name : < totalBytes > headerElement1 headerElement2 ...'
+_headerRegex = re.compile(r'^(?P<name>[^\n]+?)\s*:\s*<\s*(?P<totalBytes>\d+)\s*>(?P<tail>[ \t\d+-]*)\r?\n?$')
+
+
+def checkFileOpenInBinaryMode(file, mode):
+    '''
+    Raise IOError if the file object is not open in binary mode for reading (mode 'rb') or writing (mode 'wb').
+    File objects without the 'mode' attribute are not checked.
+    '''
     try:
         file.mode
     except:
         return
 
-    for c in mode:
-        if file.mode.find(mode) == -1:
-            raise IOError('The file for phasta io should be read/write binary. Received {0}.'.format(file.mode))
+    if 'b' not in file.mode or \
+            ('r' in mode and not any(c in file.mode for c in 'r+')) or \
+            ('w' in mode and not any(c in file.mode for c in 'wa+')):
+        raise IOError('The file for phasta io should be read/write binary. Received {0}.'.format(file.mode))
+
+
+def getIndexFileName(fileName):
+    '''
+    Get the name of the block index file (see PhastaRawFileReader) for the phasta file 'fileName'.
+    The index is stored as a hidden file next to the phasta file, e.g. '.restart.100.1.index' for 'restart.100.1'.
+    '''
+    directory, baseName = os.path.split(fileName)
+    return os.path.join(directory, '.{0}.index'.format(baseName))
+
+
+def replaceFile(sourceFileName, destinationFileName):
+    '''
+    Replace the file 'destinationFileName' with 'sourceFileName', e.g. with a temporary file written next to it.
+    '''
+    # os.replace is not available in Python 2. os.rename is atomic on POSIX systems,
+    # but refuses to overwrite an existing file on Windows.
+    if hasattr(os, 'replace'):
+        os.replace(sourceFileName, destinationFileName)
+        return
+    if os.name == 'nt' and os.path.exists(destinationFileName):
+        os.remove(destinationFileName)
+    os.rename(sourceFileName, destinationFileName)
+
+
+def copyFileRange(inFile, outFile, start, length, chunkSize=16 * 1024 * 1024):
+    '''
+    Copy 'length' bytes starting at 'start' of the file object 'inFile' to the current position of 'outFile'.
+    Raises IOError if 'inFile' ends before.
+    '''
+    inFile.seek(start)
+    while length > 0:
+        chunk = inFile.read(min(chunkSize, length))
+        if not chunk:
+            raise IOError('Unexpected end of file {0}'.format(inFile.name))
+        outFile.write(chunk)
+        length -= len(chunk)
+
+class PhastaBlockCache(object):
+    '''
+    A least-recently-used cache for the data read by PhastaRawFileReader.
+    The total size of the cached arrays is kept within 'maxBytes' by evicting the least recently used ones.
+    If 'maxBytes' is None, the size of the cache is unlimited.
+    A cache can be shared by several readers, as the cached data is keyed by file path, size and modification time.
+    The counters 'hits', 'misses' and 'evictions' and the current size 'totalBytes' are available as attributes.
+    '''
+    def __init__(self, maxBytes=None):
+        self.maxBytes = maxBytes
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        '''
+        Get the cached data without updating the counters and the recently used order.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def put(self, key, data, nBytes):
+        '''
+        Add the data to the cache.
+        :param nBytes: the memory used by the data, e.g. 0 for memory-mapped arrays.
+        Data larger than the cache's 'maxBytes' is not cached.
+        '''
+        with self._lock:
+            self._discard(key)
+            if self.maxBytes is not None and nBytes > self.maxBytes:
+                return
+            self._entries[key] = (data, nBytes)
+            self.totalBytes += nBytes
+            while self.maxBytes is not None and self.totalBytes > self.maxBytes:
+                _, (_, evictedBytes) = self._entries.popitem(last=False)
+                self.totalBytes -= evictedBytes
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.totalBytes = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.totalBytes -= entry[1]
+
+
+#: A process-wide cache, which can be passed to several instances of PhastaRawFileReader
+sharedBlockCache = PhastaBlockCache(maxBytes=1024 ** 3)
+
 
 class PhastaRawFileReader(object):
     class DataBlockDescriptor(object):
         def __init__(self):
+            self.headerPosInFile = 0
             self.posInFile = 0
             self.totalBytes = 0
             self.headerElements = []
-            self.rawData = None
 
-    def __init__(self, file):
-        _checkFileOpenInBinaryMode(file, 'rb')
+    IndexVersion = 2
+
+    def __init__(self, file, mmap=False, useIndex=False, cache=None):
+        '''
+        :param file: a file object opened in 'rb' mode
+        :param mmap: if True, the data blocks are not read into memory, but are memory-mapped instead.
+        The arrays returned by getRawData() and getDataBlock() are then backed by numpy.memmap,
+        so only the pages actually accessed are read from disk.
+        :param useIndex: if True, the block layout and byte order are taken from the index file
+        (see getIndexFileName()) instead of scanning the headers. If the index does not exist or is out of date
+        (i.e. the file size or modification time have changed), the headers are scanned and the index is rewritten.
+        :param cache: instance of PhastaBlockCache used for the data read from the file, e.g. sharedBlockCache.
+        If None, the reader uses its own cache of unlimited size.
+        '''
+        checkFileOpenInBinaryMode(file, 'rb')
         self.file = file
+        self.mmap = mmap
+        self.cache = cache if cache is not None else PhastaBlockCache()
+        try:
+            self._cacheKey = (os.path.abspath(file.name),) + self._getFileStatus()
+        except (AttributeError, OSError, IOError, ValueError):
+            self._cacheKey = (id(self),)
         self.blockDescriptors = {}
         self.byteOrderCode = '='
+        self.startPos = file.tell()
+
+        if useIndex and self.loadIndex():
+            return
+
         self.parseHeaders()
         self.detectEndiannes()
 
+        if useIndex:
+            self.saveIndex()
+
+    def _getFileStatus(self):
+        fileStat = os.fstat(self.file.fileno())
+        return fileStat.st_size, fileStat.st_mtime
+
+    def _getIndexFileName(self):
+        # None if the file has no usable name, e.g. io.BytesIO or a file object returned by os.fdopen()
+        fileName = getattr(self.file, 'name', None)
+        if not isinstance(fileName, basestring) or not os.path.isfile(fileName):
+            return None
+        return getIndexFileName(fileName)
+
+    def loadIndex(self):
+        '''
+        Load the block descriptors from the index file.
+        :return: True if the index was found and is valid for the file, False otherwise
+        '''
+        indexFileName = self._getIndexFileName()
+        if indexFileName is None:
+            return False
+
+        try:
+            with open(indexFileName, 'rb') as indexFile:
+                index = json.load(indexFile)
+            fileSize, fileModificationTime = self._getFileStatus()
+        except (IOError, OSError, ValueError):
+            return False
+
+        if index.get('version') != PhastaRawFileReader.IndexVersion or \
+                index.get('fileSize') != fileSize or \
+                index.get('fileModificationTime') != fileModificationTime or \
+                index.get('startPos') != self.startPos:
+            return False
+
+        for name, headerPosInFile, posInFile, totalBytes, headerElements in index['blocks']:
+            dataBlockDescriptor = PhastaRawFileReader.DataBlockDescriptor()
+            dataBlockDescriptor.headerPosInFile = headerPosInFile
+            dataBlockDescriptor.posInFile = posInFile
+            dataBlockDescriptor.totalBytes = totalBytes
+            dataBlockDescriptor.headerElements = headerElements
+            self.blockDescriptors[str(name)] = dataBlockDescriptor
+
+        self.byteOrderCode = str(index['byteOrderCode'])
+        return True
+
+    def saveIndex(self):
+        '''
+        Save the block descriptors to the index file.
+        Failure to write the index (e.g. in a read-only directory or for a file object without a file name)
+        is not an error.
+        '''
+        indexFileName = self._getIndexFileName()
+        if indexFileName is None:
+            return
+
+        try:
+            fileSize, fileModificationTime = self._getFileStatus()
+        except (IOError, OSError, ValueError):
+            return
+        blocks = sorted(self.blockDescriptors.iteritems(), key=lambda item: item[1].posInFile)
+        index = {
+            'version': PhastaRawFileReader.IndexVersion,
+            'fileSize': fileSize,
+            'fileModificationTime': fileModificationTime,
+            'startPos': self.startPos,
+            'byteOrderCode': self.byteOrderCode,
+            'blocks': [[name, d.headerPosInFile, d.posInFile, d.totalBytes, d.headerElements] for name, d in blocks]
+        }
+
+        try:
+            tempIndexFileName = indexFileName + '.tmp'
+            with open(tempIndexFileName, 'wb') as indexFile:
+                json.dump(index, indexFile)
+            if os.path.exists(indexFileName):
+                os.remove(indexFileName)
+            os.rename(tempIndexFileName, indexFileName)
+        except (IOError, OSError):
+            pass
+
     def parseHeaders(self):
-        headerParser = parse.compile("{name} : < {totalBytes} > {tail}")
+        '''
+        Scan the file for data block headers and fill in the block descriptors.
+        Raises IOError, which includes the byte offset of the problem, if a header cannot be parsed
+        or a data block extends past the end of the file.
+        '''
+        startPos = self.file.tell()
+        self.file.seek(0, 2)
+        fileSize = self.file.tell()
+        self.file.seek(startPos)
+
+        headerMatch = _headerRegex.match
         while True:
+            lineOffset = self.file.tell()
             l = self.file.readline()
             if not l:
                 break
@@ -44,17 +283,30 @@ class PhastaRawFileReader(object):
             if l.startswith('#') or l.startswith('\n'):
                 continue
 
-            parseResult = headerParser.parse(l)
+            parseResult = headerMatch(l)
             if parseResult is None:
-                raise IOError('Failed to parse string {0}'.format(l))
+                raise IOError('Failed to parse data block header at byte offset {0}: {1!r}'.format(lineOffset, l))
+
+            try:
+                headerElements = [int(x) for x in parseResult.group('tail').split()]
+            except ValueError:
+                raise IOError('Invalid header elements for data block at byte offset {0}: {1!r}'.format(lineOffset, l))
 
             dataBlockDescriptor = PhastaRawFileReader.DataBlockDescriptor()
-            dataBlockDescriptor.posInFile = self.file.tell()
-            dataBlockDescriptor.totalBytes = int(parseResult.named['totalBytes']) - 1
-            dataBlockDescriptor.headerElements = [int(x) for x in parseResult.named['tail'].split()]
+            dataBlockDescriptor.headerPosInFile = lineOffset
+            dataBlockDescriptor.posInFile = lineOffset + len(l)
+            dataBlockDescriptor.totalBytes = int(parseResult.group('totalBytes')) - 1
+            dataBlockDescriptor.headerElements = headerElements
+
+            blockEnd = dataBlockDescriptor.posInFile + dataBlockDescriptor.totalBytes + 1
+            if blockEnd > fileSize:
+                raise IOError('Data block \'{0}\' at byte offset {1} extends past the end of the file '
+                              '({2} bytes expected, {3} available)'.format(parseResult.group('name'), lineOffset,
+                                                                          dataBlockDescriptor.totalBytes + 1,
+                                                                          fileSize - dataBlockDescriptor.posInFile))
 
-            self.blockDescriptors[parseResult.named['name'].strip()] = dataBlockDescriptor
-            self.file.seek(dataBlockDescriptor.totalBytes + 1, 1)
+            self.blockDescriptors[parseResult.group('name').strip()] = dataBlockDescriptor
+            self.file.seek(blockEnd)
 
     def detectEndiannes(self):
         byteOrderArrayName = 'byteorder magic number'
@@ -63,13 +315,12 @@ class PhastaRawFileReader(object):
         if byteOrderArrayName not in self.blockDescriptors:
             return
 
-        magicNumber = self.getDataBlock(byteOrderArrayName, numpy.int32)
+        magicNumber = numpy.frombuffer(self.getRawData(byteOrderArrayName), dtype=numpy.int32, count=1)
         if magicNumber[0] != byteOrderExpectedValue:
+            if magicNumber.byteswap()[0] != byteOrderExpectedValue:
+                raise RuntimeError('Failed to detect endianness')
             sys_is_le = sys.byteorder == 'little'
             self.byteOrderCode = sys_is_le and '>' or '<'
-            magicNumber = self.getDataBlock(byteOrderArrayName, numpy.int32)
-            if magicNumber[0] != byteOrderExpectedValue:
-                raise RuntimeError('Failed to detect endianness')
 
     def getBlockDescriptor(self, dataBlockName):
         return self.blockDescriptors[dataBlockName]
@@ -78,35 +329,62 @@ class PhastaRawFileReader(object):
         '''
         Get raw data for the data block.
         :param dataBlockName: name of the data block
-        :return: 1d numpy.ndarray of numpy.byte
+        :return: 1d numpy.ndarray of numpy.byte (numpy.memmap if the reader was created with mmap=True)
         '''
         blockDescriptor = self.blockDescriptors[dataBlockName]
 
-        if blockDescriptor.rawData is not None:
-            return blockDescriptor.rawData
-
         if blockDescriptor.totalBytes == -1:
             raise KeyError('Block {0} has no data'.format(dataBlockName))
 
-        self.file.seek(blockDescriptor.posInFile)
-        blockDescriptor.rawData = numpy.fromfile(self.file, dtype=numpy.byte, count=blockDescriptor.totalBytes)
+        cacheKey = self._cacheKey + (dataBlockName,)
+        rawData = self.cache.get(cacheKey)
+        if rawData is not None:
+            return rawData
 
-        return blockDescriptor.rawData
+        if self.mmap and blockDescriptor.totalBytes > 0:
+            rawData = numpy.memmap(self.file, dtype=numpy.byte, mode='r', offset=blockDescriptor.posInFile,
+                                   shape=(blockDescriptor.totalBytes,))
+            self.cache.put(cacheKey, rawData, 0)
+        else:
+            self.file.seek(blockDescriptor.posInFile)
+            rawData = numpy.fromfile(self.file, dtype=numpy.byte, count=blockDescriptor.totalBytes)
+            self.cache.put(cacheKey, rawData, rawData.nbytes)
 
-    def getDataBlock(self, dataBlockName, dtype):
+        return rawData
+
+    def getItemSize(self, dataBlockName):
         '''
-        Reinterpret the raw data for 'dataBlockName' as an array of particular type.
+        Infer the size in bytes of the data block elements from the header,
+        assuming the header starts with the number of elements and the number of components (if more than 1).
+        :return: 4 or 8 if the data block is consistent with an array of such elements, 1 otherwise
+        '''
+        blockDescriptor = self.blockDescriptors[dataBlockName]
+        headerElements = blockDescriptor.headerElements
+        if blockDescriptor.totalBytes <= 0 or not headerElements or headerElements[0] <= 0:
+            return 1
+
+        for numberOfComponents in ([headerElements[1], 1] if len(headerElements) > 1 else [1]):
+            if numberOfComponents <= 0:
+                continue
+            itemSize, remainder = divmod(blockDescriptor.totalBytes, headerElements[0] * numberOfComponents)
+            if remainder == 0 and itemSize in (4, 8):
+                return itemSize
+        return 1
+
+    def getDataBlockLayout(self, dataBlockName, dtype):
+        '''
+        Compute the layout of the data block interpreted as an array of particular type.
         :param dataBlockName: name of the data block
         :param dtype: they numpy data type (e.g. 'i4' or numpy.float64)
-        :return: 2d numpy.ndarray. The arrays's first dimension is component, i.e. arrayData[1,:] means 'quantity's component 1 for all nodes'
+        :return: a tuple (element dtype in the file's byte order, number of elements, number of components)
 
         Raises KeyError if data block named 'dataBlockName' does not exist or it's header-only block (i.e. totalBytes == -1)
         '''
-
-        rawData = self.getRawData(dataBlockName)
-
         blockDescriptor = self.blockDescriptors[dataBlockName]
 
+        if blockDescriptor.totalBytes == -1:
+            raise KeyError('Block {0} has no data'.format(dataBlockName))
+
         element_dtype = numpy.dtype(dtype).newbyteorder(self.byteOrderCode)
 
         # Number of arrayelements is expected to be the first element in the header
@@ -126,22 +404,110 @@ class PhastaRawFileReader(object):
                 raise RuntimeError(
                     'Computed number of components ({0}) is inconsistent '
                     'with expected number of components saved in header ({1}) for data block \'{2}\''.format(
-                        numberOfComponents, blockDescriptor.headerElements[1], dataBlockName))
+                        numberOfComponents, blockDescriptor.headerElements[1:2], dataBlockName))
+
+        return element_dtype, numberOfElements, numberOfComponents
+
+    def getDataBlock(self, dataBlockName, dtype):
+        '''
+        Reinterpret the raw data for 'dataBlockName' as an array of particular type.
+        :param dataBlockName: name of the data block
+        :param dtype: they numpy data type (e.g. 'i4' or numpy.float64)
+        :return: 2d numpy.ndarray. The arrays's first dimension is component, i.e. arrayData[1,:] means 'quantity's component 1 for all nodes'
+        If the reader was created with mmap=True, the array is a view of the memory-mapped file contents.
+        The byte order of the file is handled by the array's dtype, so no conversion pass over the data is performed.
+
+        Raises KeyError if data block named 'dataBlockName' does not exist or it's header-only block (i.e. totalBytes == -1)
+        '''
+        element_dtype, numberOfElements, numberOfComponents = self.getDataBlockLayout(dataBlockName, dtype)
+
+        rawData = self.getRawData(dataBlockName)
 
         # Each component is stored in a contiguous array
         array_dtype = numpy.dtype('{0}{1}'.format(numberOfElements, element_dtype.str))
 
         return numpy.frombuffer(rawData, dtype=array_dtype, count=numberOfComponents)
 
+    def getDataBlockComponents(self, dataBlockName, dtype, startIndex, nComponents):
+        '''
+        Read only the components [startIndex, startIndex + nComponents) of the data block.
+        Since each component is stored contiguously, only the requested part of the data block is read from the file.
+        If the raw data for the block has already been read, or the reader uses mmap, the result is a view of it.
+        The result is always in the native byte order, only the requested components are byte-swapped if necessary.
+        :return: 2d numpy.ndarray with shape (nComponents, number of elements)
+
+        Raises KeyError if data block named 'dataBlockName' does not exist or it's header-only block (i.e. totalBytes == -1)
+        '''
+        element_dtype, numberOfElements, numberOfComponents = self.getDataBlockLayout(dataBlockName, dtype)
+
+        if startIndex < 0 or nComponents < 0 or startIndex + nComponents > numberOfComponents:
+            raise IndexError(
+                'Components [{0}, {1}) are out of range for data block \'{2}\' with {3} components'.format(
+                    startIndex, startIndex + nComponents, dataBlockName, numberOfComponents))
+
+        blockDescriptor = self.blockDescriptors[dataBlockName]
+        if not element_dtype.isnative:
+            nativeDataBlock = self.cache.peek(self._cacheKey + (dataBlockName, element_dtype.newbyteorder('=').str))
+            if nativeDataBlock is not None:
+                return nativeDataBlock[startIndex:(startIndex + nComponents), :]
+
+        if self.mmap or self.cache.peek(self._cacheKey + (dataBlockName,)) is not None:
+            data = self.getDataBlock(dataBlockName, dtype)[startIndex:(startIndex + nComponents), :]
+            return data if data.dtype.isnative else data.byteswap().view(data.dtype.newbyteorder())
+
+        self.file.seek(blockDescriptor.posInFile + startIndex * numberOfElements * element_dtype.itemsize)
+        data = numpy.fromfile(self.file, dtype=element_dtype, count=nComponents * numberOfElements)
+        if not data.dtype.isnative:
+            data = data.byteswap(True).view(data.dtype.newbyteorder())
+        return data.reshape((nComponents, numberOfElements))
+
+    def getNativeDataBlock(self, dataBlockName, dtype):
+        '''
+        Same as getDataBlock(), but the returned array is always C-contiguous and in the native byte order.
+        If the file byte order is the native one, the array is a view of the raw data and no copy is made.
+        Otherwise the data block is byte-swapped in a single pass, and the swapped array replaces the raw data
+        in the reader's cache.
+        :return: 2d numpy.ndarray with shape (nComponents, nElements)
+
+        Raises KeyError if data block named 'dataBlockName' does not exist or it's header-only block (i.e. totalBytes == -1)
+        '''
+        native_dtype = numpy.dtype(dtype).newbyteorder('=')
+        if numpy.dtype(dtype).newbyteorder(self.byteOrderCode).isnative:
+            return self.getDataBlock(dataBlockName, native_dtype)
+
+        cacheKey = self._cacheKey + (dataBlockName, native_dtype.str)
+        dataBlock = self.cache.get(cacheKey)
+        if dataBlock is None:
+            dataBlock = self.getDataBlock(dataBlockName, dtype)
+            dataBlock = dataBlock.byteswap().view(dataBlock.dtype.newbyteorder())
+            # The raw data is not needed any more. Unless it is memory-mapped, keeping it would double the memory
+            if not self.mmap:
+                self.cache.discard(self._cacheKey + (dataBlockName,))
+            self.cache.put(cacheKey, dataBlock, dataBlock.nbytes)
+
+        return dataBlock
+
 class PhastaRawFileWriter(object):
     '''
     Writer for phasta data files
     If 'append' is False (default), the header containing the byte order magic number will be automatically written to the file
     '''
 
-    def __init__(self, file):
-        _checkFileOpenInBinaryMode(file, 'wb')
+    # The maximum size of the temporary arrays used for converting the data to the file byte order
+    ConversionChunkBytes = 4 * 1024 * 1024
+
+    def __init__(self, file, byteOrder='='):
+        '''
+        :param file: a file object opened in 'wb' mode
+        :param byteOrder: the byte order of the data written by writeDataBlock() and writeDataBlockComponents(),
+        '<' (little-endian), '>' (big-endian) or '=' (native). The data is converted in chunks of at most
+        ConversionChunkBytes bytes while writing. The data written by writeRawData() is not converted.
+        '''
+        checkFileOpenInBinaryMode(file, 'wb')
+        if byteOrder not in ('=', '<', '>'):
+            raise ValueError('Invalid byte order {0!r}, expected \'<\', \'>\' or \'=\''.format(byteOrder))
         self.file = file
+        self.byteOrderCode = byteOrder
 
     def writeFileHeader(self):
         self.file.write('''# PHASTA Input File Version 2.0
@@ -197,28 +563,174 @@ class PhastaRawFileWriter(object):
             headerData += additionalHeaderData
 
         # Write data
-        rawData = numpy.frombuffer(arrayData, dtype=numpy.byte)
-        self.writeRawData(name, rawData, headerData)
+        self.writeHeader(name, arrayData.nbytes + 1, headerData)  # + 1 for '\n'
+        self._writeElements(arrayData)
+        self.file.write('\n')
+
+    def writeElements(self, name, elements, additionalHeaderData=None):
+        '''
+        Write a 1d array of elements, converted to the file byte order, as a data block with the header
+        'name : < totalBytesInArray > [additionalHeaderData...]', i.e. the header is not derived from the array shape.
+        '''
+        self.writeHeader(name, elements.nbytes + 1, additionalHeaderData)  # + 1 for '\n'
+        self._writeElements(elements)
+        self.file.write('\n')
+
+    def _writeElements(self, arrayData, dtype=None):
+        # Convert the data to 'dtype' in the file byte order and write it, one chunk at a time
+        arrayData = numpy.ravel(arrayData)
+        fileDType = numpy.dtype(dtype if dtype is not None else arrayData.dtype).newbyteorder(self.byteOrderCode)
+        if fileDType == arrayData.dtype:
+            arrayData.tofile(self.file)
+            return
+
+        chunkElements = max(1, PhastaRawFileWriter.ConversionChunkBytes // arrayData.dtype.itemsize)
+        for start in xrange(0, arrayData.shape[0], chunkElements):
+            arrayData[start:(start + chunkElements)].astype(fileDType).tofile(self.file)
+
+    def writeDataBlockComponents(self, name, componentRows, nComponents, nElements, dtype, additionalHeaderData=None):
+        '''
+        Write a data block component by component, without assembling the whole block in memory.
+        The header is identical to the one written by writeDataBlock() for an array of shape (nComponents, nElements).
+        :param name: data block name
+        :param componentRows: an iterable yielding nComponents 1d arrays of nElements elements each
+        :param nComponents: number of components in the data block
+        :param nElements: number of elements in each component
+        :param dtype: the numpy data type of the data block. Component rows of different type are converted one at a time
+        :param additionalHeaderData: must be a sequence or None
+        '''
+        dtype = numpy.dtype(dtype)
+
+        headerData = [nElements]
+        if nComponents > 1:
+            headerData.append(nComponents)
+        if additionalHeaderData is not None:
+            headerData += additionalHeaderData
+
+        self.writeHeader(name, nComponents * nElements * dtype.itemsize + 1, headerData)  # + 1 for '\n'
+
+        nComponentsWritten = 0
+        for row in componentRows:
+            if nComponentsWritten == nComponents:
+                raise IndexError('More than {0} components provided for data block {1}'.format(nComponents, name))
+            row = numpy.asarray(row)
+            if row.size != nElements:
+                raise IndexError('Component {0} of data block {1} has {2} elements, expected {3}'.format(
+                    nComponentsWritten, name, row.size, nElements))
+            self._writeElements(row, dtype)
+            nComponentsWritten += 1
+
+        if nComponentsWritten != nComponents:
+            raise IndexError('Only {0} of {1} components provided for data block {2}'.format(
+                nComponentsWritten, nComponents, name))
+
+        self.file.write('\n')
+
+    def writeDataBlockChunks(self, name, chunks, nComponents, nElements, dtype, additionalHeaderData=None,
+                             elementChunks=False):
+        '''
+        Write a data block of arbitrary size from a sequence of chunks, holding only one chunk in memory at a time.
+        The header, identical to the one written by writeDataBlock() for an array of shape (nComponents, nElements),
+        is written before the first chunk is requested.
+        If the chunks do not add up to the declared size, IndexError is raised and the data block is left incomplete.
+        :param name: data block name
+        :param chunks: an iterable yielding numpy arrays (or array-like objects). If 'elementChunks' is False,
+        the chunks' elements are written in the file order, i.e. all the elements of the first component,
+        then all the elements of the second component etc., and a chunk may span several components.
+        If 'elementChunks' is True, each chunk must have the shape (nComponents, k) and contains the next
+        k elements of all the components. In this case the file must be seekable and not opened in append mode.
+        :param nComponents: number of components in the data block
+        :param nElements: number of elements in each component
+        :param dtype: the numpy data type of the data block. Chunks of different type are converted
+        :param additionalHeaderData: must be a sequence or None
+        :param elementChunks: see 'chunks'
+        '''
+        dtype = numpy.dtype(dtype)
+
+        headerData = [nElements]
+        if nComponents > 1:
+            headerData.append(nComponents)
+        if additionalHeaderData is not None:
+            headerData += additionalHeaderData
+
+        totalElements = nComponents * nElements
+        self.writeHeader(name, totalElements * dtype.itemsize + 1, headerData)  # + 1 for '\n'
+
+        if not elementChunks:
+            nWritten = 0
+            for chunk in chunks:
+                chunk = numpy.asarray(chunk)
+                if nWritten + chunk.size > totalElements:
+                    raise IndexError('More than {0} elements provided for data block {1}'.format(totalElements, name))
+                self._writeElements(chunk, dtype)
+                nWritten += chunk.size
+
+            if nWritten != totalElements:
+                raise IndexError('Only {0} of {1} elements provided for data block {2}'.format(
+                    nWritten, totalElements, name))
+        else:
+            if 'a' in getattr(self.file, 'mode', ''):
+                raise IOError('Writing element chunks requires a file not opened in append mode')
+
+            dataStart = self.file.tell()
+            nWritten = 0
+            for chunk in chunks:
+                chunk = numpy.asarray(chunk)
+                if chunk.ndim != 2 or chunk.shape[0] != nComponents:
+                    raise IndexError('Element chunk of shape {0} provided for data block {1}, expected ({2}, k)'.format(
+                        chunk.shape, name, nComponents))
+                if nWritten + chunk.shape[1] > nElements:
+                    raise IndexError('More than {0} elements provided for data block {1}'.format(nElements, name))
+                for component in xrange(nComponents):
+                    self.file.seek(dataStart + (component * nElements + nWritten) * dtype.itemsize)
+                    self._writeElements(chunk[component], dtype)
+                nWritten += chunk.shape[1]
+
+            if nWritten != nElements:
+                raise IndexError('Only {0} of {1} elements provided for data block {2}'.format(
+                    nWritten, nElements, name))
+            self.file.seek(dataStart + totalElements * dtype.itemsize)
+
+        self.file.write('\n')
 
 
 def _extractFieldFromDataBlock(dataBlock, startIndex, nComponents):
     return dataBlock[startIndex:(startIndex + nComponents), :]
 
-def _embedFieldToDataBlock(dataBlock, fieldData, startIndex, nComponents):
-    dataBlock[startIndex:(startIndex + nComponents), :] = fieldData
-
-def readPhastaFile(rawReader, config):
+def readPhastaFile(rawReader, config, fields=None):
     '''
     Read a phasta file using a configuration which defines conversion from raw data blocks to data fields
     :param rawReader: instance of PhastaRawFileReader
     :param config: configuration (instance of PhastaConfig)
+    :param fields: optional sequence of field names to read. If provided, only the components of the data blocks
+    covered by these fields are read from the file and the data blocks without requested fields are not accessed.
     :return: a dictionary {'field name': numpy.ndarray}.
     The returned 2d arrays' first dimension is (usually node) index
     '''
+    requestedFields = None
+    if fields is not None:
+        requestedFields = set(fields)
+        for fieldName in requestedFields:
+            if config.findDescriptorAndField(fieldName)[0] is None:
+                raise KeyError('Array descriptor for field {0} was not found'.format(fieldName))
+
     result = {}
     for arrayDesc in config.arrayDescriptors:
+        fieldsToRead = [f for f in arrayDesc.fields
+                        if f.name is not None and (requestedFields is None or f.name in requestedFields)]
+        if not fieldsToRead:
+            continue
+
         try:
-            dataBlock = rawReader.getDataBlock(arrayDesc.phastaDataBlockName, arrayDesc.dataType)
+            if requestedFields is None:
+                dataBlock = rawReader.getNativeDataBlock(arrayDesc.phastaDataBlockName, arrayDesc.dataType)
+                for field in fieldsToRead:
+                    result[field.name] = _extractFieldFromDataBlock(dataBlock, field.startIndex, field.nComponents)
+            else:
+                for field in fieldsToRead:
+                    result[field.name] = rawReader.getDataBlockComponents(arrayDesc.phastaDataBlockName,
+                                                                          arrayDesc.dataType,
+                                                                          field.startIndex, field.nComponents)
         except KeyError:
             if not arrayDesc.optional:
                 raise KeyError(
@@ -227,20 +739,124 @@ def readPhastaFile(rawReader, config):
             else:
                 continue
 
-        for field in (f for f in arrayDesc.fields if f.name is not None):
-            result[field.name] = _extractFieldFromDataBlock(dataBlock, field.startIndex, field.nComponents)
+    return result
+
 
+def transposeAndConvert(fieldData, dtype, chunkElements=1024 * 1024):
+    '''
+    Transpose the field data, e.g. as returned by readPhastaFile(), into a new array owning its memory.
+    The data is converted a chunk of elements at a time, so that no full-size temporary array is created.
+    :param fieldData: numpy.ndarray of shape (nComponents, nElements)
+    :param dtype: the data type of the result, e.g. numpy.float32 for reduced-precision storage
+    :return: C-contiguous numpy.ndarray of shape (nElements, nComponents)
+    '''
+    result = numpy.empty((fieldData.shape[1], fieldData.shape[0]), dtype)
+    for start in xrange(0, fieldData.shape[1], chunkElements):
+        result[start:(start + chunkElements)] = fieldData[:, start:(start + chunkElements)].transpose()
     return result
 
 
-def writePhastaFile(rawWriter, config, fields):
+class PhastaFieldSource(object):
     '''
-    Write a phasta file using a configuration which defines conversion from raw data blocks to data fields
-    :param rawWriter: instance of PhastaRawFileWriter
-    :param config: configuration (instance of PhastaConfig). If no fields for a particular data block are provided, the data block will be skipped
-    :param fields: a dictionary {'field name': numpy.ndarray}.
+    A lazy source of a field stored in a phasta file, e.g. for SolutionStorage.ArrayInfo.
+    The source only holds the field's location and layout. The data is read by load() through a memory map
+    of the file and copied into memory, so the file can be rewritten once it is loaded.
     '''
+    def __init__(self, fileName, dataBlockName, dtype, startIndex, nComponents, nElements, fileStatus=None,
+                 storageDtype=None, blockPosInFile=None, byteOrderCode='='):
+        '''
+        :param dtype: the data type of the data block in the file
+        :param fileStatus: the (size, modification time) of the file when the layout was read. If provided,
+        load() raises IOError if the file has changed since
+        :param storageDtype: if not None, the data type of the array returned by load(), e.g. numpy.float32
+        to halve the memory used by a float64 field. The data is converted once, while loading
+        :param blockPosInFile: the position of the data block's data in the file. If provided (together with
+        the file's byteOrderCode, see PhastaRawFileReader), load() maps the field directly
+        without reading the file headers again
+        '''
+        self.fileName = fileName
+        self.dataBlockName = dataBlockName
+        self.fileDtype = numpy.dtype(dtype)
+        self.startIndex = startIndex
+        self.fileStatus = fileStatus
+        self.blockPosInFile = blockPosInFile
+        self.byteOrderCode = byteOrderCode
+        #: the shape and type of the array returned by load()
+        self.shape = (nElements, nComponents)
+        self.dtype = numpy.dtype(storageDtype) if storageDtype is not None else self.fileDtype
+
+    def load(self):
+        '''
+        :return: a C-contiguous numpy.ndarray of shape (nElements, nComponents), i.e. the transposed field data.
+        The array owns its memory and does not refer to the file
+        '''
+        with open(self.fileName, 'rb') as inFile:
+            if self.fileStatus is not None:
+                fileStat = os.fstat(inFile.fileno())
+                if (fileStat.st_size, fileStat.st_mtime) != self.fileStatus:
+                    raise IOError('Phasta file {0} has changed since the solution was loaded'.format(self.fileName))
+
+            if self.blockPosInFile is None:
+                rawReader = PhastaRawFileReader(inFile, mmap=True)
+                fieldData = rawReader.getDataBlockComponents(self.dataBlockName, self.fileDtype, self.startIndex,
+                                                             self.shape[1])
+                return transposeAndConvert(fieldData, self.dtype)
+
+            nElements, nComponents = self.shape
+            element_dtype = self.fileDtype.newbyteorder(self.byteOrderCode)
+            fieldData = numpy.memmap(inFile, dtype=element_dtype, mode='r', shape=(nComponents, nElements),
+                                     offset=self.blockPosInFile + self.startIndex * nElements * element_dtype.itemsize)
+            try:
+                return transposeAndConvert(fieldData, self.dtype)
+            finally:
+                del fieldData
+
+
+def createPhastaFieldSources(fileName, config, storageDataTypes=None):
+    '''
+    Create lazy sources for the fields in a phasta file. Only the headers of the file are read, once for all
+    the fields: the sources keep the positions of their data blocks, so loading them does not scan the headers again.
+    :param fileName: name of the phasta file
+    :param config: configuration (instance of PhastaConfig)
+    :param storageDataTypes: optional dictionary {'field name': numpy data type}, see PhastaFieldSource's storageDtype
+    :return: an OrderedDict {'field name': PhastaFieldSource} in the order of the configuration.
+    The fields of missing optional data blocks are skipped
+    '''
+    storageDataTypes = storageDataTypes or {}
+    result = OrderedDict()
+    with open(fileName, 'rb') as inFile:
+        rawReader = PhastaRawFileReader(inFile)
+        fileStatus = rawReader._getFileStatus()
+
+        for arrayDesc in config.arrayDescriptors:
+            try:
+                _, numberOfElements, numberOfComponents = rawReader.getDataBlockLayout(arrayDesc.phastaDataBlockName,
+                                                                                       arrayDesc.dataType)
+            except KeyError:
+                if not arrayDesc.optional:
+                    raise KeyError('A non-optional data block {0} not found in phasta file {1}'.format(
+                        arrayDesc.phastaDataBlockName, fileName))
+                continue
+            blockPosInFile = rawReader.getBlockDescriptor(arrayDesc.phastaDataBlockName).posInFile
 
+            for field in arrayDesc.fields:
+                if field.name is None:
+                    continue
+                if field.startIndex + field.nComponents > numberOfComponents:
+                    raise IndexError('Field {0} is out of range of data block {1} in phasta file {2}'.format(
+                        field.name, arrayDesc.phastaDataBlockName, fileName))
+                result[field.name] = PhastaFieldSource(fileName, arrayDesc.phastaDataBlockName, arrayDesc.dataType,
+                                                       field.startIndex, field.nComponents, numberOfElements,
+                                                       fileStatus, storageDataTypes.get(field.name),
+                                                       blockPosInFile, rawReader.byteOrderCode)
+
+    return result
+
+def _groupFieldsByDescriptor(config, fields):
+    '''
+    Find the array descriptors for the fields and check the fields' data against the configuration.
+    :return: a dictionary {arrayDescriptor: {fieldDescriptor: numpy.ndarray}}
+    '''
     descriptorToFieldsMap = {}
 
     for fieldName, fieldData in fields.iteritems():
@@ -250,37 +866,226 @@ def writePhastaFile(rawWriter, config, fields):
 
         descriptorToFieldsMap.setdefault(arrayDesc, {})[fieldDesc] = fieldData
 
-    for arrayDesc in (x for x in config.arrayDescriptors if x in descriptorToFieldsMap):
-        # Compose the full data back from fields
-        totalNComponents = reduce(max, [f.startIndex + f.nComponents for f in arrayDesc.fields], 0)
-
-        fieldsForThisArray = descriptorToFieldsMap[arrayDesc]
-
-        firstFieldData = fieldsForThisArray.itervalues().next()
-        numElements = firstFieldData.shape[1]
-
-        # Allocate storage for all fields
-        dataBlockShape = [totalNComponents, numElements]
-        dataBlock = numpy.zeros(dataBlockShape, arrayDesc.dataType)
+    for arrayDesc, fieldsForThisArray in descriptorToFieldsMap.iteritems():
+        numElements = fieldsForThisArray.itervalues().next().shape[1]
 
         for fieldDesc, fieldData in fieldsForThisArray.iteritems():
-            # Sanity checks
-            if fieldData.dtype != arrayDesc.dataType:
+            # Reduced-precision fields (e.g. float32) are converted to the data block type when written
+            blockDtype = numpy.dtype(arrayDesc.dataType)
+            if fieldData.dtype.kind != blockDtype.kind or fieldData.dtype.itemsize > blockDtype.itemsize:
                 raise IndexError(
                     'Field {0} for data block {1} has incorrect dtype'.format(fieldDesc.name,
-                                                                              arrayDesc.phastaArrayName))
+                                                                              arrayDesc.phastaDataBlockName))
             if fieldData.shape[0] != fieldDesc.nComponents:
                 raise IndexError(
                     'Field with name {0} has a different number of components ({1}) '
                     'than expected by configuration ({2})'.format(fieldDesc.name, fieldData.shape[0],
                                                                   fieldDesc.nComponents))
 
-            if fieldData.shape[1] != dataBlockShape[1]:
+            if fieldData.shape[1] != numElements:
                 raise IndexError(
-                    'Fields for data block {0} have different number of elements'.format(arrayDesc.phastaArrayName))
+                    'Fields for data block {0} have different number of elements'.format(arrayDesc.phastaDataBlockName))
+
+    return descriptorToFieldsMap
+
+
+def writePhastaFile(rawWriter, config, fields, timeStep=0):
+    '''
+    Write a phasta file using a configuration which defines conversion from raw data blocks to data fields
+    :param rawWriter: instance of PhastaRawFileWriter
+    :param config: configuration (instance of PhastaConfig). If no fields for a particular data block are provided, the data block will be skipped
+    :param fields: a dictionary {'field name': numpy.ndarray}.
+    :param timeStep: the time step written as the last header element of each data block
+    '''
+    _writeDataBlocks(rawWriter, config, _groupFieldsByDescriptor(config, fields), timeStep)
 
-            _embedFieldToDataBlock(dataBlock, fieldData, fieldDesc.startIndex, fieldDesc.nComponents)
+
+def _iterComponentRows(arrayDesc, fieldsForThisArray, numElements):
+    # Yield the rows of all the components of the data block from the provided fields.
+    # Components not covered by the provided fields are filled with zeros
+    componentSources = {}
+    for fieldDesc, fieldData in fieldsForThisArray.iteritems():
+        for i in xrange(fieldDesc.nComponents):
+            componentSources[fieldDesc.startIndex + i] = (fieldData, i)
+
+    zeroRow = numpy.zeros(numElements, arrayDesc.dataType)
+    for component in xrange(arrayDesc.nComponents):
+        if component in componentSources:
+            fieldData, i = componentSources[component]
+            yield fieldData[i]
+        else:
+            yield zeroRow
+
+
+def _writeDataBlocks(rawWriter, config, descriptorToFieldsMap, timeStep=0, additionalHeaderData=None):
+    # additionalHeaderData: optional {arrayDesc: header elements written after the layout}, replacing [timeStep]
+    for arrayDesc in (x for x in config.arrayDescriptors if x in descriptorToFieldsMap):
+        fieldsForThisArray = descriptorToFieldsMap[arrayDesc]
+        numElements = fieldsForThisArray.itervalues().next().shape[1]
 
         # Write data to file
-        timeStep = 0 # TODO: time step handling
-        rawWriter.writeDataBlock(arrayDesc.phastaDataBlockName, dataBlock, additionalHeaderData=[timeStep])
+        rawWriter.writeDataBlockComponents(arrayDesc.phastaDataBlockName,
+                                           _iterComponentRows(arrayDesc, fieldsForThisArray, numElements),
+                                           arrayDesc.nComponents, numElements, arrayDesc.dataType,
+                                           additionalHeaderData=(additionalHeaderData or {}).get(arrayDesc,
+                                                                                                  [timeStep]))
+
+
+def _getHeaderTail(blockDescriptor, nComponents):
+    # The header elements following the layout, i.e. the number of elements and
+    # the number of components (written only if more than 1), e.g. the time step
+    return blockDescriptor.headerElements[(2 if nComponents > 1 else 1):]
+
+
+def patchPhastaFile(fileName, config, fields, timeStep=None, inPlace=True):
+    '''
+    Replace the data for the 'fields' in an existing phasta file without rewriting the whole file.
+    As in writePhastaFile(), each data block containing any of the fields is replaced as a whole,
+    i.e. the components of the data block not provided by the fields are filled with zeros.
+    If all the replaced data blocks exist in the file with the expected number of elements and components
+    (and header), they are overwritten in place and new data blocks are appended to the end of the file.
+    Note that an interrupted in-place write leaves the file partially patched.
+    Otherwise, i.e. if any data block has a different size or 'inPlace' is False, the file is rewritten
+    from the first replaced data block onwards into a temporary file in the same folder,
+    which then replaces the original file, so the original file is left untouched if the patching fails.
+    :param fileName: name of the phasta file
+    :param config: configuration (instance of PhastaConfig)
+    :param fields: a dictionary {'field name': numpy.ndarray}, see writePhastaFile()
+    :param timeStep: the time step written as the last header element of the replaced data blocks.
+    If None, the replaced data blocks keep the trailing header elements (e.g. the time step) of the existing ones
+    and the new data blocks get the trailing header elements of the first data block of the configuration
+    found in the file
+    :param inPlace: if False, the file is always rewritten through a temporary file
+    '''
+    descriptorToFieldsMap = _groupFieldsByDescriptor(config, fields)
+
+    with open(fileName, 'rb') as inFile:
+        rawReader = PhastaRawFileReader(inFile)
+
+    # The trailing header elements of the data blocks written
+    defaultHeaderTail = [timeStep] if timeStep is not None else [0]
+    if timeStep is None:
+        for arrayDesc in config.arrayDescriptors:
+            if arrayDesc.phastaDataBlockName in rawReader.blockDescriptors:
+                defaultHeaderTail = _getHeaderTail(rawReader.getBlockDescriptor(arrayDesc.phastaDataBlockName),
+                                                   arrayDesc.nComponents)
+                break
+    headerTails = {}
+
+    inPlaceDescriptors = []
+    appendedDescriptors = []
+    resizedDescriptors = []
+    for arrayDesc, fieldsForThisArray in descriptorToFieldsMap.iteritems():
+        if arrayDesc.phastaDataBlockName not in rawReader.blockDescriptors:
+            headerTails[arrayDesc] = defaultHeaderTail
+            appendedDescriptors.append(arrayDesc)
+            continue
+
+        existingHeaderTail = _getHeaderTail(rawReader.getBlockDescriptor(arrayDesc.phastaDataBlockName),
+                                            arrayDesc.nComponents)
+        headerTails[arrayDesc] = [timeStep] if timeStep is not None else existingHeaderTail
+
+        numElements = fieldsForThisArray.itervalues().next().shape[1]
+        try:
+            layout = rawReader.getDataBlockLayout(arrayDesc.phastaDataBlockName, arrayDesc.dataType)
+        except (KeyError, RuntimeError):
+            layout = None
+
+        if layout is not None and layout[1:] == (numElements, arrayDesc.nComponents) and \
+                headerTails[arrayDesc] == existingHeaderTail:
+            inPlaceDescriptors.append(arrayDesc)
+        else:
+            resizedDescriptors.append(arrayDesc)
+
+    if resizedDescriptors or not inPlace:
+        _rewritePhastaFileTail(fileName, rawReader, config, descriptorToFieldsMap,
+                               inPlaceDescriptors + resizedDescriptors, headerTails)
+        return
+
+    with open(fileName, 'r+b') as outFile:
+        for arrayDesc in inPlaceDescriptors:
+            blockDescriptor = rawReader.getBlockDescriptor(arrayDesc.phastaDataBlockName)
+            element_dtype, numberOfElements, _ = rawReader.getDataBlockLayout(arrayDesc.phastaDataBlockName,
+                                                                              arrayDesc.dataType)
+            outFile.seek(blockDescriptor.posInFile)
+            for row in _iterComponentRows(arrayDesc, descriptorToFieldsMap[arrayDesc], numberOfElements):
+                numpy.ascontiguousarray(row, dtype=element_dtype).tofile(outFile)
+
+        if appendedDescriptors:
+            outFile.seek(0, 2)
+            originalSize = outFile.tell()
+            try:
+                _writeDataBlocks(PhastaRawFileWriter(outFile, byteOrder=rawReader.byteOrderCode), config,
+                                 dict((arrayDesc, descriptorToFieldsMap[arrayDesc])
+                                      for arrayDesc in appendedDescriptors),
+                                 additionalHeaderData=headerTails)
+            except:
+                outFile.truncate(originalSize)
+                raise
+
+
+def _rewritePhastaFileTail(fileName, rawReader, config, descriptorToFieldsMap, replacedDescriptors, headerTails):
+    # Copy the file up to the first replaced data block and the data blocks following it, except the replaced ones,
+    # into a temporary file, then write all the replaced and new data blocks and replace the original file
+    blocksToReplace = set(arrayDesc.phastaDataBlockName for arrayDesc in replacedDescriptors)
+    blocks = sorted(rawReader.blockDescriptors.iteritems(), key=lambda item: item[1].posInFile)
+    cutPos = min([d.headerPosInFile for name, d in blocks if name in blocksToReplace] or
+                 [os.path.getsize(fileName)])
+
+    tempFileHandle, tempFileName = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fileName)))
+    os.close(tempFileHandle)
+    try:
+        with open(fileName, 'rb') as inFile, open(tempFileName, 'wb') as tempFile:
+            copyFileRange(inFile, tempFile, 0, cutPos)
+            for name, d in blocks:
+                if d.headerPosInFile < cutPos or name in blocksToReplace:
+                    continue
+                copyFileRange(inFile, tempFile, d.headerPosInFile, d.posInFile + d.totalBytes + 1 - d.headerPosInFile)
+
+            _writeDataBlocks(PhastaRawFileWriter(tempFile, byteOrder=rawReader.byteOrderCode), config,
+                             descriptorToFieldsMap, additionalHeaderData=headerTails)
+
+        shutil.copymode(fileName, tempFileName)
+        replaceFile(tempFileName, fileName)
+    except:
+        if os.path.exists(tempFileName):
+            os.remove(tempFileName)
+        raise
+
+
+def convertPhastaFileByteOrder(inFileName, outFileName, byteOrder, itemSizes=None):
+    '''
+    Write a copy of a phasta file in another byte order, e.g. '>' for big-endian machines.
+    The input file is memory-mapped and the data blocks are converted in bounded chunks,
+    so the memory used does not depend on the file size.
+    :param byteOrder: the output byte order, see PhastaRawFileWriter
+    :param itemSizes: optional dictionary {'data block name': element size in bytes} for the data blocks for which
+    the element size cannot be inferred from the header (see PhastaRawFileReader.getItemSize())
+    '''
+    itemSizes = itemSizes or {}
+
+    with open(inFileName, 'rb') as inFile:
+        rawReader = PhastaRawFileReader(inFile, mmap=True, cache=PhastaBlockCache(maxBytes=0))
+        inputByteOrder = rawReader.byteOrderCode
+
+        blocks = sorted(rawReader.blockDescriptors.iteritems(), key=lambda item: item[1].posInFile)
+        for name, blockDescriptor in blocks:
+            if blockDescriptor.totalBytes > 0 and itemSizes.get(name, rawReader.getItemSize(name)) == 1:
+                raise ValueError('Cannot infer the element size of data block \'{0}\' in phasta file {1}. '
+                                 'Provide it in \'itemSizes\''.format(name, inFileName))
+
+        with open(outFileName, 'wb') as outFile:
+            rawWriter = PhastaRawFileWriter(outFile, byteOrder=byteOrder)
+            rawWriter.writeFileHeader()
+
+            for name, blockDescriptor in blocks:
+                if name == 'byteorder magic number':
+                    continue
+                if blockDescriptor.totalBytes == -1:
+                    rawWriter.writeHeader(name, 0, blockDescriptor.headerElements)
+                    continue
+
+                itemSize = itemSizes.get(name, rawReader.getItemSize(name))
+                elements = numpy.frombuffer(rawReader.getRawData(name),
+                                            dtype=numpy.dtype('u{0}'.format(itemSize)).newbyteorder(inputByteOrder))
+                rawWriter.writeElements(name, elements, blockDescriptor.headerElements)
@@ -0,0 +1,75 @@
+import numpy
+
+from CRIMSONSolver.SolverStudies.PhastaTimeSeries import iterPhastaFiles
+
+
+class RunningStatistics(object):
+    '''
+    Element-wise running mean, variance, minimum and maximum of a sequence of equally shaped arrays,
+    computed with Welford's algorithm in float64. The memory used does not depend on the number of arrays.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.min = None
+        self.max = None
+        self._m2 = None
+        self._delta = None
+
+    def update(self, data):
+        '''
+        Add an array to the statistics.
+        '''
+        data = numpy.asarray(data)
+        if self.count == 0:
+            self.mean = numpy.array(data, dtype=numpy.float64)
+            self.min = self.mean.copy()
+            self.max = self.mean.copy()
+            self._m2 = numpy.zeros_like(self.mean)
+            self._delta = numpy.empty_like(self.mean)
+            self.count = 1
+            return
+
+        if data.shape != self.mean.shape:
+            raise ValueError('Expected an array of shape {0}, got {1}'.format(self.mean.shape, data.shape))
+
+        self.count += 1
+        # delta = x - mean; mean += delta / n; m2 += delta * (x - mean)
+        numpy.subtract(data, self.mean, out=self._delta)
+        self.mean += self._delta / self.count
+        self._m2 += self._delta * (data - self.mean)
+        numpy.minimum(self.min, data, out=self.min)
+        numpy.maximum(self.max, data, out=self.max)
+
+    def getVariance(self, ddof=0):
+        '''
+        :param ddof: delta degrees of freedom, i.e. 0 for the population variance and 1 for the sample variance
+        :return: numpy.ndarray of the variance, or None if fewer than ddof + 1 arrays were added
+        '''
+        if self.count <= ddof:
+            return None
+        return self._m2 / (self.count - ddof)
+
+
+def accumulatePhastaStatistics(fileNames, config, fields, prefetch=2, useIndex=False):
+    '''
+    Compute the running statistics of the fields over a sequence of phasta files, e.g. 'ybar.*' or 'restart.*'.
+    The files are read one at a time, prefetched on a background thread (see PhastaTimeSeries.iterPhastaFiles()).
+    To get the statistics of all the components of a data block, pass a configuration with a field covering
+    the whole data block, e.g. PhastaConfig.ybarAllComponentsConfig with the field 'ybar components'.
+    :param fileNames: a sequence of phasta file names, e.g. as returned by PhastaTimeSeries.findPhastaFiles()
+    :param config: configuration (instance of PhastaConfig)
+    :param fields: a sequence of field names
+    :param prefetch: the maximum number of files read ahead
+    :param useIndex: passed to PhastaRawFileReader
+    :return: a dictionary {'field name': RunningStatistics}. The statistics' arrays have the shape
+    (nComponents, nNodes), as the arrays returned by readPhastaFile()
+    '''
+    fields = list(fields)
+    result = dict((fieldName, RunningStatistics()) for fieldName in fields)
+
+    for _, fileFields in iterPhastaFiles(fileNames, config, fields, prefetch=prefetch, useIndex=useIndex):
+        for fieldName in fields:
+            result[fieldName].update(fileFields[fieldName])
+
+    return result
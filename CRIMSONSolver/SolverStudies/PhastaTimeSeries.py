@@ -0,0 +1,257 @@
+import os
+import re
+import sys
+import threading
+import numpy
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, readPhastaFile
+
+
+def findPhastaFiles(directory, prefix='restart', partition=1, firstStep=None, lastStep=None):
+    '''
+    Find the phasta files named '<prefix>.<timeStep>.<partition>' in a directory.
+    :param directory: the directory to search
+    :param prefix: file name prefix, e.g. 'restart' or 'ybar'
+    :param partition: the partition number, i.e. the last part of the file name
+    :param firstStep: if not None, the files for earlier time steps are skipped
+    :param lastStep: if not None, the files for later time steps are skipped
+    :return: a list of (timeStep, fileName) tuples sorted by time step
+    '''
+    fileNameRegex = re.compile(r'^{0}\.(\d+)\.{1}$'.format(re.escape(prefix), partition))
+
+    result = []
+    for fileName in os.listdir(directory):
+        match = fileNameRegex.match(fileName)
+        if match is None:
+            continue
+
+        timeStep = int(match.group(1))
+        if (firstStep is not None and timeStep < firstStep) or (lastStep is not None and timeStep > lastStep):
+            continue
+
+        result.append((timeStep, os.path.join(directory, fileName)))
+
+    return sorted(result)
+
+
+# Matches the time step in the phasta file names, e.g. 'restart.<timeStep>.<partition>'
+_fileNameTimeStepRegex = re.compile(r'\.(\d+)\.\d+$')
+
+
+def readTimeStepAndLayout(fileName, config, fields, useIndex=False):
+    '''
+    Read the time step and the layout of the fields from the headers of a phasta file, without reading the data.
+    The time step is the trailing element of the data block header following the number of elements
+    and the number of components (written only if more than 1), e.g. 'solution : < ... > nNodes 5 timeStep'
+    or 'custom_error_indicator : < ... > nNodes timeStep'. If the headers have no time step,
+    the time step in the file name is used.
+    :param fileName: name of the phasta file
+    :param config: configuration (instance of PhastaConfig)
+    :param fields: a sequence of field names
+    :param useIndex: passed to PhastaRawFileReader
+    :return: a tuple (timeStep or None, {'field name': (nComponents, nElements, dtype)},
+    {'field name': (offset in the file, element dtype in the file's byte order)}).
+    As the data blocks are stored component by component, each field is a contiguous range of the file
+    starting at the offset
+    '''
+    layouts = {}
+    positions = {}
+    timeStep = None
+    with open(fileName, 'rb') as inFile:
+        rawReader = PhastaRawFileReader(inFile, useIndex=useIndex)
+
+        for fieldName in fields:
+            arrayDesc, fieldDesc = config.findDescriptorAndField(fieldName)
+            if arrayDesc is None:
+                raise KeyError('Array descriptor for field {0} was not found'.format(fieldName))
+            if arrayDesc.phastaDataBlockName not in rawReader.blockDescriptors:
+                raise KeyError('Data block {0} for field {1} not found in phasta file {2}'.format(
+                    arrayDesc.phastaDataBlockName, fieldName, fileName))
+
+            element_dtype, numberOfElements, numberOfComponents = rawReader.getDataBlockLayout(
+                arrayDesc.phastaDataBlockName, arrayDesc.dataType)
+            if fieldDesc.startIndex + fieldDesc.nComponents > numberOfComponents:
+                raise IndexError('Field {0} is out of range of data block {1} in phasta file {2}'.format(
+                    fieldName, arrayDesc.phastaDataBlockName, fileName))
+            layouts[fieldName] = (fieldDesc.nComponents, numberOfElements, numpy.dtype(arrayDesc.dataType))
+
+            blockDescriptor = rawReader.getBlockDescriptor(arrayDesc.phastaDataBlockName)
+            positions[fieldName] = (
+                blockDescriptor.posInFile + fieldDesc.startIndex * numberOfElements * element_dtype.itemsize,
+                element_dtype)
+
+            headerElements = blockDescriptor.headerElements
+            nLayoutHeaderElements = 2 if numberOfComponents > 1 else 1
+            if timeStep is None and len(headerElements) > nLayoutHeaderElements:
+                timeStep = headerElements[-1]
+
+    if timeStep is None:
+        match = _fileNameTimeStepRegex.search(os.path.basename(fileName))
+        if match is not None:
+            timeStep = int(match.group(1))
+
+    return timeStep, layouts, positions
+
+
+def readPhastaTimeSeries(fileNames, config, fields, maxWorkers=4, useIndex=False):
+    '''
+    Read the fields from a sequence of phasta files, e.g. 'restart.<timeStep>.1' for a range of time steps.
+    The files are read concurrently by at most 'maxWorkers' threads directly into the preallocated result arrays,
+    using the layout found when the headers are scanned to order the files, i.e. each file's headers are read once.
+    :param fileNames: a sequence of phasta file names, e.g. as returned by findPhastaFiles()
+    :param config: configuration (instance of PhastaConfig)
+    :param fields: a sequence of field names to read
+    :param maxWorkers: the maximum number of files read at the same time
+    :param useIndex: passed to PhastaRawFileReader
+    :return: a tuple (timeSteps, {'field name': numpy.ndarray}), where timeSteps is a 1d numpy.ndarray and the
+    fields' arrays have the shape (nSteps, nComponents, nNodes). The steps are ordered by the time step stored
+    in the data block headers, or in the file names if the headers do not contain the time step.
+    If neither contains the time step, the order of 'fileNames' is kept.
+    '''
+    fileNames = [x[1] if isinstance(x, tuple) else x for x in fileNames]
+    fields = list(fields)
+
+    pool = ThreadPool(max(1, min(maxWorkers, len(fileNames))))
+    try:
+        timeStepsAndLayouts = pool.map(lambda fileName: readTimeStepAndLayout(fileName, config, fields, useIndex),
+                                       fileNames)
+
+        if timeStepsAndLayouts and all(timeStep is not None for timeStep, _, _ in timeStepsAndLayouts):
+            order = sorted(xrange(len(fileNames)), key=lambda i: timeStepsAndLayouts[i][0])
+            timeSteps = numpy.array([timeStepsAndLayouts[i][0] for i in order])
+        else:
+            order = range(len(fileNames))
+            timeSteps = numpy.arange(len(fileNames))
+
+        result = {}
+        for fieldName in fields:
+            layouts = set(layouts[fieldName] for _, layouts, _ in timeStepsAndLayouts)
+            if len(layouts) > 1:
+                raise RuntimeError('Field {0} has different number of elements in the files'.format(fieldName))
+            for nComponents, numberOfElements, dtype in layouts:
+                result[fieldName] = numpy.empty((len(fileNames), nComponents, numberOfElements), dtype)
+
+        def readStep(stepIndex):
+            fileName = fileNames[order[stepIndex]]
+            _, _, positions = timeStepsAndLayouts[order[stepIndex]]
+            with open(fileName, 'rb') as inFile:
+                for fieldName in fields:
+                    offset, element_dtype = positions[fieldName]
+                    stepData = result[fieldName][stepIndex]
+                    inFile.seek(offset)
+                    if inFile.readinto(stepData) != stepData.nbytes:
+                        raise IOError('Unexpected end of file {0}'.format(fileName))
+                    if not element_dtype.isnative:
+                        stepData.byteswap(True)
+
+        pool.map(readStep, xrange(len(fileNames)))
+    finally:
+        pool.close()
+        pool.join()
+
+    return timeSteps, result
+
+
+def _estimateFieldBytes(rawReader, config, fields):
+    # The number of bytes read by readPhastaFile(), computed from the data block headers.
+    # Without the list of fields, readPhastaFile() reads each data block with a named field as a whole,
+    # including the components not covered by the fields
+    nBytes = 0
+    for arrayDesc in config.arrayDescriptors:
+        if arrayDesc.phastaDataBlockName not in rawReader.blockDescriptors:
+            continue
+        try:
+            _, numberOfElements, numberOfComponents = rawReader.getDataBlockLayout(arrayDesc.phastaDataBlockName,
+                                                                                   arrayDesc.dataType)
+        except (KeyError, RuntimeError):
+            continue
+        itemSize = numpy.dtype(arrayDesc.dataType).itemsize
+        if fields is None:
+            if any(field.name is not None for field in arrayDesc.fields):
+                nBytes += numberOfComponents * numberOfElements * itemSize
+            continue
+        for field in arrayDesc.fields:
+            if field.name in fields:
+                nBytes += field.nComponents * numberOfElements * itemSize
+    return nBytes
+
+
+def iterPhastaFiles(fileNames, config, fields, prefetch=2, maxBytes=None, useIndex=False):
+    '''
+    Iterate over the fields of a sequence of phasta files, reading the next files on a background thread
+    while the caller processes the current one.
+    :param fileNames: a sequence of phasta file names, e.g. as returned by findPhastaFiles()
+    :param config: configuration (instance of PhastaConfig)
+    :param fields: a sequence of field names to read, or None to read all the fields
+    :param prefetch: the maximum number of files read ahead of the caller
+    :param maxBytes: if not None, the files read ahead hold at most 'maxBytes' bytes. The size of a file's fields
+    is computed from its headers before its data is read. At least one file is always read ahead,
+    even if it is larger than 'maxBytes'
+    :param useIndex: passed to PhastaRawFileReader
+    :return: a generator of (fileName, {'field name': numpy.ndarray}) tuples in the order of 'fileNames'
+    '''
+    fileNames = [x[1] if isinstance(x, tuple) else x for x in fileNames]
+    fields = list(fields) if fields is not None else None
+    prefetch = max(1, prefetch)
+
+    condition = threading.Condition()
+    readAhead = deque()
+    state = {'bytes': 0, 'stopped': False}
+
+    def waitForSpace(itemBytes):
+        # Wait until the file fits into the read-ahead limits. Returns False if the iteration was stopped
+        with condition:
+            while not state['stopped'] and readAhead and (
+                    len(readAhead) >= prefetch or (maxBytes is not None and state['bytes'] + itemBytes > maxBytes)):
+                condition.wait()
+            return not state['stopped']
+
+    def reader():
+        for fileName in fileNames:
+            fileFields, excInfo, itemBytes = None, None, 0
+            try:
+                with open(fileName, 'rb') as inFile:
+                    rawReader = PhastaRawFileReader(inFile, useIndex=useIndex)
+                    # Reserve the space before reading the data, so that the limits are never exceeded
+                    itemBytes = _estimateFieldBytes(rawReader, config, fields)
+                    if not waitForSpace(itemBytes):
+                        return
+                    fileFields = readPhastaFile(rawReader, config, fields)
+            except Exception:
+                excInfo = sys.exc_info()
+
+            if not waitForSpace(itemBytes):
+                return
+            with condition:
+                if state['stopped']:
+                    return
+                readAhead.append((fileName, fileFields, excInfo, itemBytes))
+                state['bytes'] += itemBytes
+                condition.notify_all()
+
+            if excInfo is not None:
+                return
+
+    readerThread = threading.Thread(target=reader)
+    readerThread.daemon = True
+    readerThread.start()
+
+    try:
+        for _ in xrange(len(fileNames)):
+            with condition:
+                while not readAhead:
+                    condition.wait()
+                fileName, fileFields, excInfo, itemBytes = readAhead.popleft()
+                state['bytes'] -= itemBytes
+                condition.notify_all()
+
+            if excInfo is not None:
+                raise excInfo[0], excInfo[1], excInfo[2]
+            yield fileName, fileFields
+    finally:
+        with condition:
+            state['stopped'] = True
+            condition.notify_all()
+        readerThread.join()
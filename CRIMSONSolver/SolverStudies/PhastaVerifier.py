@@ -0,0 +1,204 @@
+import os
+import json
+import hashlib
+import multiprocessing
+import numpy
+
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, PhastaBlockCache
+
+
+class VerificationResult(object):
+    '''
+    The result of verifying a single phasta file.
+    '''
+    def __init__(self, fileName):
+        self.fileName = fileName
+        #: a list of strings describing the problems found
+        self.errors = []
+        #: {'field name': (number of NaN values, number of infinite values)}
+        self.nonFiniteCounts = {}
+        #: SHA-1 of the file contents, if requested
+        self.checksum = None
+
+    @property
+    def ok(self):
+        return not self.errors and not any(nNaN or nInf for nNaN, nInf in self.nonFiniteCounts.itervalues())
+
+
+def computeChecksum(fileName, chunkSize=16 * 1024 * 1024):
+    '''
+    :return: SHA-1 hex digest of the file contents
+    '''
+    checksum = hashlib.sha1()
+    with open(fileName, 'rb') as inFile:
+        while True:
+            chunk = inFile.read(chunkSize)
+            if not chunk:
+                break
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def verifyPhastaFile(fileName, config=None, checksum=False):
+    '''
+    Verify a single phasta file:
+    the data block headers must be parsable and each data block must fit into the file and be followed by a newline;
+    the byte order magic number must be present and valid;
+    if 'config' is given, the data blocks of its (non-optional) array descriptors must be present and consistent
+    with their headers, and the NaN and infinite values of the floating-point fields are counted.
+    :param config: configuration (instance of PhastaConfig) or None
+    :param checksum: if True, the SHA-1 checksum of the file is computed
+    :return: instance of VerificationResult
+    '''
+    result = VerificationResult(fileName)
+
+    try:
+        if checksum:
+            result.checksum = computeChecksum(fileName)
+
+        with open(fileName, 'rb') as inFile:
+            try:
+                rawReader = PhastaRawFileReader(inFile, mmap=True, cache=PhastaBlockCache(maxBytes=0))
+            except (IOError, RuntimeError) as e:
+                result.errors.append(str(e))
+                return result
+
+            if 'byteorder magic number' not in rawReader.blockDescriptors:
+                result.errors.append('The byte order magic number data block is missing')
+
+            for blockName, blockDescriptor in rawReader.blockDescriptors.iteritems():
+                # Header-only blocks (i.e. '< 0 >') have no data and no trailing newline
+                if blockDescriptor.totalBytes == -1:
+                    continue
+                inFile.seek(blockDescriptor.posInFile + blockDescriptor.totalBytes)
+                if inFile.read(1) != '\n':
+                    result.errors.append('Data block \'{0}\' is not followed by a newline'.format(blockName))
+
+            if config is not None:
+                _verifyFields(rawReader, _describeConfig(config), result)
+    except (IOError, OSError) as e:
+        result.errors.append(str(e))
+
+    return result
+
+
+def _describeConfig(config):
+    # PhastaConfig cannot be pickled (its descriptor classes are nested), so the worker processes receive
+    # the configuration as plain tuples
+    if isinstance(config, list):
+        return config
+    return [(arrayDesc.phastaDataBlockName, numpy.dtype(arrayDesc.dataType).str, arrayDesc.optional,
+             [(field.name, field.startIndex, field.nComponents) for field in arrayDesc.fields if field.name is not None])
+            for arrayDesc in config.arrayDescriptors]
+
+
+def _verifyFields(rawReader, configDescription, result):
+    for blockName, dataType, optional, fields in configDescription:
+        if blockName not in rawReader.blockDescriptors:
+            if not optional:
+                result.errors.append('Non-optional data block \'{0}\' is missing'.format(blockName))
+            continue
+
+        try:
+            dataBlock = rawReader.getDataBlock(blockName, numpy.dtype(dataType))
+        except (KeyError, RuntimeError) as e:
+            result.errors.append(str(e).strip('\''))
+            continue
+
+        if not numpy.issubdtype(dataBlock.dtype, numpy.floating):
+            continue
+
+        for fieldName, startIndex, nComponents in fields:
+            nNaN = nInf = 0
+            # Count row by row to keep the temporary arrays small
+            for row in dataBlock[startIndex:(startIndex + nComponents)]:
+                nNaN += numpy.count_nonzero(numpy.isnan(row))
+                nInf += numpy.count_nonzero(numpy.isinf(row))
+            result.nonFiniteCounts[fieldName] = (nNaN, nInf)
+
+
+def _verifyPhastaFileArgs(args):
+    return verifyPhastaFile(*args)
+
+
+def _map(function, arguments, maxWorkers):
+    if maxWorkers <= 1 or len(arguments) <= 1:
+        return map(function, arguments)
+
+    pool = multiprocessing.Pool(min(maxWorkers, len(arguments)))
+    try:
+        return pool.map(function, arguments)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def writeManifest(fileNames, manifestFileName, maxWorkers=4):
+    '''
+    Record the sizes and checksums of phasta files in a manifest, to be checked by verifyPhastaFiles().
+    The files are identified by their base names.
+    '''
+    checksums = _map(computeChecksum, list(fileNames), maxWorkers)
+
+    manifest = {'files': {}}
+    for fileName, checksum in zip(fileNames, checksums):
+        manifest['files'][os.path.basename(fileName)] = {'size': os.path.getsize(fileName), 'sha1': checksum}
+
+    with open(manifestFileName, 'w') as manifestFile:
+        json.dump(manifest, manifestFile, indent=1, sort_keys=True)
+
+
+def verifyPhastaFiles(fileNames, config=None, manifestFileName=None, maxWorkers=4):
+    '''
+    Verify phasta files in a process pool, see verifyPhastaFile().
+    Note that the function must be called from the main module guarded by "if __name__ == '__main__'"
+    when used in a standalone script on Windows. Use maxWorkers=1 to verify the files in the calling process.
+    :param fileNames: a sequence of phasta file names, e.g. as returned by PhastaTimeSeries.findPhastaFiles()
+    :param config: configuration (instance of PhastaConfig) or None
+    :param manifestFileName: if not None, the sizes and checksums of the files are checked against the manifest
+    written by writeManifest()
+    :param maxWorkers: the maximum number of processes
+    :return: a list of VerificationResult in the order of 'fileNames'
+    '''
+    fileNames = [x[1] if isinstance(x, tuple) else x for x in fileNames]
+
+    manifest = None
+    if manifestFileName is not None:
+        with open(manifestFileName, 'r') as manifestFile:
+            manifest = json.load(manifestFile)['files']
+
+    configDescription = _describeConfig(config) if config is not None else None
+    results = _map(_verifyPhastaFileArgs,
+                   [(fileName, configDescription, manifest is not None) for fileName in fileNames], maxWorkers)
+
+    if manifest is not None:
+        for result in results:
+            entry = manifest.get(os.path.basename(result.fileName))
+            if entry is None:
+                result.errors.append('The file is not listed in the manifest')
+            elif os.path.exists(result.fileName) and os.path.getsize(result.fileName) != entry['size']:
+                result.errors.append('Size mismatch: {0} bytes in the manifest, {1} bytes on disk'.format(
+                    entry['size'], os.path.getsize(result.fileName)))
+            elif result.checksum is not None and result.checksum != entry['sha1']:
+                result.errors.append('Checksum mismatch: {0} in the manifest, {1} computed'.format(
+                    entry['sha1'], result.checksum))
+
+    return results
+
+
+def formatVerificationReport(results):
+    '''
+    :return: a human-readable report of the results of verifyPhastaFiles()
+    '''
+    lines = []
+    for result in results:
+        lines.append('{0}: {1}'.format(result.fileName, 'OK' if result.ok else 'FAILED'))
+        for error in result.errors:
+            lines.append('    {0}'.format(error))
+        for fieldName, (nNaN, nInf) in sorted(result.nonFiniteCounts.iteritems()):
+            if nNaN or nInf:
+                lines.append('    {0}: {1} NaN, {2} infinite values'.format(fieldName, nNaN, nInf))
+
+    nFailed = sum(1 for result in results if not result.ok)
+    lines.append('{0} files verified, {1} failed'.format(len(results), nFailed))
+    return '\n'.join(lines)
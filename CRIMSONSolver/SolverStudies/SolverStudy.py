@@ -1,7 +1,6 @@
 import os
 import shutil
 import subprocess
-import tempfile
 from collections import OrderedDict
 import numpy
 import math
@@ -15,7 +14,7 @@ from PythonQt.CRIMSON import FaceType
 from PythonQt.CRIMSON import Utils
 
 from CRIMSONCore.SolutionStorage import SolutionStorage
-from CRIMSONSolver.SolverStudies import PresolverExecutableName, PhastaSolverIO, PhastaConfig
+from CRIMSONSolver.SolverStudies import PresolverExecutableName, PhastaSolverIO, PhastaConfig, PhastaSolutionLoader
 from CRIMSONSolver.SolverSetupManagers.FlowProfileGenerator import FlowProfileGenerator
 from CRIMSONSolver.SolverStudies.FileList import FileList
 from CRIMSONSolver.SolverStudies.SolverInpData import SolverInpData
@@ -123,7 +122,8 @@ class SolverStudy(object):
         if not fullNames:
             return
 
-        solutions = SolutionStorage()
+        fileNames = []
+        configs = []
         for fullName in fullNames:
             fileName = os.path.basename(fullName)
             if fileName.startswith('restart'):
@@ -136,18 +136,51 @@ class SolverStudy(object):
                                            "Only 'restart.*' and 'ybar.*' files are supported.".format(
                                                fullName))
                 continue
-            try:
-                with open(fullName, 'rb') as inFile:
-                    fields = PhastaSolverIO.readPhastaFile(PhastaSolverIO.PhastaRawFileReader(inFile), config)
-
-                for fieldName, fieldData in fields.iteritems():
-                    solutions.arrays[fieldName] = SolutionStorage.ArrayInfo(fieldData.transpose())
+            fileNames.append(fullName)
+            configs.append(config)
+
+        # Reduced precision halves (float32) or quarters (float16) the memory used by large solutions.
+        # The restart files are always written with double precision
+        storageDataTypes = None
+        if fileNames and QtGui.QMessageBox.question(None, 'Store the solution with reduced precision?',
+                                                    'Would you like to store the loaded solution with reduced '
+                                                    'precision to halve the memory it uses?',
+                                                    QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
+                                                    QtGui.QMessageBox.No) == QtGui.QMessageBox.Yes:
+            storageDataTypes = PhastaSolutionLoader.getReducedPrecisionDataTypes(configs)
+
+        progressDialog = QtGui.QProgressDialog('Loading solution...', 'Cancel', 0, len(fileNames))
+        progressDialog.setMinimumDuration(0)
+
+        def reportProgress(nFilesLoaded, nFiles, nBytesLoaded, nBytes):
+            progressDialog.setLabelText('Loading solution... {0} of {1} files ({2:.0f} of {3:.0f} MB)'.format(
+                nFilesLoaded, nFiles, nBytesLoaded / 1e6, nBytes / 1e6))
+            progressDialog.setValue(nFilesLoaded)
+            QtGui.QApplication.processEvents()
+            return not progressDialog.wasCanceled()
+
+        # The data is read and converted by the worker threads, so that the progress dialog covers the whole loading
+        # and cancelling it stops the loading of the remaining files
+        loadResults = PhastaSolutionLoader.loadPhastaFiles(fileNames, configs, eager=True,
+                                                           progressCallback=reportProgress,
+                                                           storageDataTypes=storageDataTypes)
+        progressDialog.close()
+
+        if progressDialog.wasCanceled():
+            return
 
-            except Exception as e:
+        # Merge in the order of selection, so that the fields from later files replace the ones from earlier files
+        solutions = SolutionStorage()
+        for loadResult in loadResults:
+            if loadResult.error is not None:
                 QtGui.QMessageBox.critical(None, "Solution loading failed",
-                                           "Failed to load solution from file {0}:\n{1}.".format(fullName, str(e)))
+                                           "Failed to load solution from file {0}:\n{1}.".format(
+                                               loadResult.fileName, str(loadResult.error)))
                 continue
 
+            for fieldName, fieldData in loadResult.fields.iteritems():
+                solutions.arrays[fieldName] = SolutionStorage.ArrayInfo(fieldData)
+
         return solutions
 
     def runFlowsolver(self):
@@ -235,6 +268,10 @@ class SolverStudy(object):
             fileList['numstart.dat', 'wb'].write('0\n')
             fileList.close()
 
+            if solutionStorage is not None:
+                # The solutions may be loaded from the restart file which is about to be overwritten by the presolver
+                solutionStorage.loadArrays()
+
             with Timer('Ran presolver'):
                 self._runPresolver(os.path.join(outputDir, 'presolver', 'the.supre'), outputDir,
                                    ['geombc.dat.1', 'restart.0.1'])
@@ -253,36 +290,18 @@ class SolverStudy(object):
 
     def _appendSolutionsToRestart(self, outputDir, solutionStorage):
         restartFileName = os.path.join(outputDir, 'restart.0.1')
-        with open(restartFileName, 'rb') as restartFile:
-            rawReader = PhastaSolverIO.PhastaRawFileReader(restartFile)
-            dataBlocksToReplace = ['byteorder magic number']
-            newFields = {}
-            for name, dataInfo in solutionStorage.arrays.iteritems():
-                arrayDesc, fieldDesc = PhastaConfig.restartConfig.findDescriptorAndField(name)
-                if arrayDesc is None:
-                    Utils.logWarning(
-                        'Cannot write solution \'{0}\' to the restart file. Skipping.'.format(name))
-                    continue
-                Utils.logInformation('Appending solution data \'{0}\'...'.format(name))
-
-                dataBlocksToReplace.append(arrayDesc.phastaDataBlockName)
-                newFields[fieldDesc.name] = dataInfo.data.transpose()
-
-            _, tempFileName = tempfile.mkstemp()
-            with open(tempFileName, 'wb') as tempFile:
-                rawWriter = PhastaSolverIO.PhastaRawFileWriter(tempFile)
-                rawWriter.writeFileHeader()
-
-                for blockName, blockDescriptor in rawReader.blockDescriptors.iteritems():
-                    if blockDescriptor.totalBytes == -1:  # header only
-                        rawWriter.writeHeader(blockName, 0, blockDescriptor.headerElements)
-                    elif blockName not in dataBlocksToReplace:  # header and data
-                        rawWriter.writeRawData(blockName, rawReader.getRawData(blockName),
-                                               blockDescriptor.headerElements)
-
-                PhastaSolverIO.writePhastaFile(rawWriter, PhastaConfig.restartConfig, newFields)
-
-        shutil.copy(tempFileName, restartFileName)
+        newFields = {}
+        for name, dataInfo in solutionStorage.arrays.iteritems():
+            arrayDesc, fieldDesc = PhastaConfig.restartConfig.findDescriptorAndField(name)
+            if arrayDesc is None:
+                Utils.logWarning(
+                    'Cannot write solution \'{0}\' to the restart file. Skipping.'.format(name))
+                continue
+            Utils.logInformation('Appending solution data \'{0}\'...'.format(name))
+
+            newFields[fieldDesc.name] = dataInfo.data.transpose()
+
+        PhastaSolverIO.patchPhastaFile(restartFileName, PhastaConfig.restartConfig, newFields)
 
     def _runPresolver(self, supreFile, outputDir, outputFiles):
         presolverExecutable = os.path.normpath(os.path.join(os.path.realpath(__file__), os.pardir,
@@ -0,0 +1,12 @@
+class QByteArray(bytearray):
+    ''' A minimal QByteArray for the tests, holding the data in a bytearray. '''
+
+    def reserve(self, size):
+        pass
+
+    def size(self):
+        return len(self)
+
+    def append(self, data, size=None):
+        self.extend(data[:size] if size is not None else data)
+        return self
@@ -0,0 +1,166 @@
+'''
+Micro-benchmarks for PhastaSolverIO.
+Run from the 'tests' folder: python benchmarkPhastaSolverIO.py
+'''
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import os
+import tempfile
+import time
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaIO, PhastaRawFileReader, PhastaRawFileWriter, \
+    readPhastaFile
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig
+
+fixtureFileName = r'testData\restart.1300.0'
+
+
+def _bestTime(function, repeat=5):
+    best = float('inf')
+    for _ in xrange(repeat):
+        start = time.time()
+        function()
+        best = min(best, time.time() - start)
+    return best
+
+
+def _writeReplicatedFixture(fileName, nCopies, maxBlockElements=64):
+    '''
+    Write a phasta file containing 'nCopies' copies of every block of the fixture file.
+    Data blocks are cut down to 'maxBlockElements' elements so that the file stays small and the scan time
+    is dominated by the header parsing.
+    '''
+    with open(fixtureFileName, 'rb') as inFile:
+        reader = PhastaRawFileReader(inFile)
+        blocks = sorted(reader.blockDescriptors.iteritems(), key=lambda item: item[1].posInFile)
+
+        with open(fileName, 'wb') as outFile:
+            writer = PhastaRawFileWriter(outFile)
+            writer.writeFileHeader()
+            nBlocks = 1
+            for copy in xrange(nCopies):
+                for blockName, blockDescriptor in blocks:
+                    name = '{0} {1}'.format(blockName, copy)
+                    if blockDescriptor.totalBytes == -1:
+                        writer.writeHeader(name, 0, blockDescriptor.headerElements)
+                    else:
+                        rawData = reader.getRawData(blockName)[:maxBlockElements * 8]
+                        writer.writeRawData(name, rawData, blockDescriptor.headerElements)
+                    nBlocks += 1
+    return nBlocks
+
+
+def _parseHeadersWithParseLibrary(file):
+    # The header scanner PhastaRawFileReader used before switching to the precompiled regular expression
+    import parse
+    headerParser = parse.compile("{name} : < {totalBytes} > {tail}")
+    while True:
+        l = file.readline()
+        if not l:
+            break
+        if l.startswith('#') or l.startswith('\n'):
+            continue
+        parseResult = headerParser.parse(l)
+        [int(x) for x in parseResult.named['tail'].split()]
+        file.seek(int(parseResult.named['totalBytes']), 1)
+
+
+def benchmarkHeaderScan(nCopies=1000):
+    _, fileName = tempfile.mkstemp()
+    try:
+        nBlocks = _writeReplicatedFixture(fileName, nCopies)
+
+        def scan():
+            with open(fileName, 'rb') as inFile:
+                PhastaRawFileReader(inFile)
+
+        elapsed = _bestTime(scan)
+        print('Header scan: {0} blocks in {1:.1f} ms ({2:.0f} blocks/s)'.format(
+            nBlocks, elapsed * 1000, nBlocks / elapsed))
+
+        try:
+            import parse
+        except ImportError:
+            return
+
+        def scanWithParse():
+            with open(fileName, 'rb') as inFile:
+                _parseHeadersWithParseLibrary(inFile)
+
+        elapsed = _bestTime(scanWithParse)
+        print('Header scan (parse library): {0} blocks in {1:.1f} ms ({2:.0f} blocks/s)'.format(
+            nBlocks, elapsed * 1000, nBlocks / elapsed))
+    finally:
+        os.remove(fileName)
+
+
+def _writeSolutionFile(fileName, solution, byteOrder):
+    with open(fileName, 'wb') as outFile:
+        rawWriter = PhastaRawFileWriter(outFile)
+        magicNumber = numpy.array([PhastaIO.ByteOrderMagicNumber], numpy.dtype(numpy.int32).newbyteorder(byteOrder))
+        rawWriter.writeRawData('byteorder magic number', magicNumber.view(numpy.byte), [1])
+        data = solution.astype(solution.dtype.newbyteorder(byteOrder))
+        rawWriter.writeRawData('solution', data.view(numpy.byte).ravel(), list(solution.shape[::-1]) + [0])
+
+
+def benchmarkByteOrder(nNodes=2000000):
+    solution = numpy.random.RandomState(0).rand(5, nNodes)
+    for byteOrder in ['<', '>']:
+        _, fileName = tempfile.mkstemp()
+        try:
+            _writeSolutionFile(fileName, solution, byteOrder)
+
+            def readAll():
+                with open(fileName, 'rb') as inFile:
+                    readPhastaFile(PhastaRawFileReader(inFile), restartConfig)
+
+            def readPressure():
+                with open(fileName, 'rb') as inFile:
+                    readPhastaFile(PhastaRawFileReader(inFile), restartConfig, fields=['pressure'])
+
+            megabytes = solution.nbytes / 1e6
+            elapsed = _bestTime(readAll)
+            print('Read {0} ({1:.0f} MB, {2} endian): {3:.1f} ms ({4:.0f} MB/s)'.format(
+                'solution', megabytes, byteOrder == '<' and 'little' or 'big', elapsed * 1000, megabytes / elapsed))
+            elapsed = _bestTime(readPressure)
+            print('Read {0} ({1:.0f} MB, {2} endian): {3:.1f} ms ({4:.0f} MB/s)'.format(
+                'pressure', megabytes / 5, byteOrder == '<' and 'little' or 'big', elapsed * 1000,
+                megabytes / 5 / elapsed))
+        finally:
+            os.remove(fileName)
+
+
+def benchmarkArchive():
+    from CRIMSONSolver.SolverStudies.PhastaArchive import PhastaArchiveReader, archivePhastaFile, lzma
+
+    codecs = ['raw', 'zlib', 'bz2'] + (['lzma'] if lzma is not None else [])
+    originalSize = os.path.getsize(fixtureFileName)
+    for codec in codecs:
+        for shuffle in [False, True]:
+            _, fileName = tempfile.mkstemp()
+            try:
+                start = time.time()
+                archivePhastaFile(fixtureFileName, fileName, codec=codec, shuffle=shuffle)
+                compressionTime = time.time() - start
+
+                def readAll():
+                    with open(fileName, 'rb') as inFile:
+                        archiveReader = PhastaArchiveReader(inFile, cache=None)
+                        archiveReader.prefetch()
+                        readPhastaFile(archiveReader, restartConfig)
+
+                elapsed = _bestTime(readAll)
+                print('Archive {0:>4} (shuffle={1:d}): ratio {2:.2f}, compress {3:.1f} ms, read {4:.1f} ms '
+                      '({5:.0f} MB/s)'.format(codec, shuffle, originalSize / float(os.path.getsize(fileName)),
+                                              compressionTime * 1000, elapsed * 1000, originalSize / 1e6 / elapsed))
+            finally:
+                os.remove(fileName)
+
+
+if __name__ == '__main__':
+    benchmarkHeaderScan()
+    benchmarkByteOrder()
+    benchmarkArchive()
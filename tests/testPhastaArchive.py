@@ -0,0 +1,66 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, readPhastaFile
+from CRIMSONSolver.SolverStudies.PhastaArchive import PhastaArchiveReader, archivePhastaFile, extractPhastaArchive
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig
+
+
+class TestArchive(unittest.TestCase):
+    fixtureFileName = r'testData\restart.1300.0'
+
+    @classmethod
+    def setUp(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        with open(cls.fixtureFileName, 'rb') as inFile:
+            cls.fields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig)
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def test_read(self):
+        for codec in ['raw', 'zlib', 'bz2']:
+            for shuffle in [False, True]:
+                archiveFileName = os.path.join(self.tempDir, 'restart.{0}.{1}.archive'.format(codec, shuffle))
+                archivePhastaFile(self.fixtureFileName, archiveFileName, codec=codec, shuffle=shuffle)
+
+                with open(archiveFileName, 'rb') as inFile:
+                    archiveReader = PhastaArchiveReader(inFile)
+                    archiveReader.prefetch()
+                    fields = readPhastaFile(archiveReader, restartConfig)
+                    pressure = readPhastaFile(archiveReader, restartConfig, ['pressure'])['pressure']
+
+                self.assertListEqual(sorted(fields.keys()), sorted(self.fields.keys()))
+                for name, data in self.fields.iteritems():
+                    self.assertTrue(numpy.array_equal(fields[name], data))
+                self.assertTrue(numpy.array_equal(pressure, self.fields['pressure']))
+
+    def test_extract(self):
+        archiveFileName = os.path.join(self.tempDir, 'restart.archive')
+        extractedFileName = os.path.join(self.tempDir, 'restart.1300.0')
+        archivePhastaFile(self.fixtureFileName, archiveFileName)
+        extractPhastaArchive(archiveFileName, extractedFileName)
+
+        with open(self.fixtureFileName, 'rb') as originalFile, open(extractedFileName, 'rb') as extractedFile:
+            originalReader = PhastaRawFileReader(originalFile)
+            extractedReader = PhastaRawFileReader(extractedFile)
+            self.assertListEqual(sorted(originalReader.blockDescriptors.keys()),
+                                 sorted(extractedReader.blockDescriptors.keys()))
+            for name, blockDescriptor in originalReader.blockDescriptors.iteritems():
+                extractedDescriptor = extractedReader.getBlockDescriptor(name)
+                self.assertListEqual(extractedDescriptor.headerElements, blockDescriptor.headerElements)
+                if blockDescriptor.totalBytes != -1:
+                    self.assertTrue(numpy.array_equal(extractedReader.getRawData(name),
+                                                      originalReader.getRawData(name)))
+
+    def test_not_archive(self):
+        with open(self.fixtureFileName, 'rb') as inFile:
+            self.assertRaises(IOError, PhastaArchiveReader, inFile)
@@ -0,0 +1,39 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaConfig import PhastaConfig, restartConfig
+
+
+class TestPhastaConfig(unittest.TestCase):
+    def test_find(self):
+        arrayDesc, fieldDesc = restartConfig.findDescriptorAndField('velocity')
+        self.assertEqual(arrayDesc.phastaDataBlockName, 'solution')
+        self.assertEqual((fieldDesc.startIndex, fieldDesc.nComponents), (1, 3))
+        self.assertEqual(arrayDesc.nComponents, 5)
+        self.assertTupleEqual(restartConfig.findDescriptorAndField('UNKNOWN'), (None, None))
+
+    def test_many_fields(self):
+        nSpecies = 500
+        config = PhastaConfig([
+            PhastaConfig.ArrayDescriptor('species', numpy.float64, False,
+                                         [PhastaConfig.Field('concentration {0}'.format(i), i, 1)
+                                          for i in reversed(xrange(nSpecies))]),
+        ])
+        self.assertEqual(config.arrayDescriptors[0].nComponents, nSpecies)
+        self.assertEqual(config.findDescriptorAndField('concentration 123')[1].startIndex, 123)
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            PhastaConfig.ArrayDescriptor('solution', numpy.float64, False,
+                                         [PhastaConfig.Field('velocity', 1, 3), PhastaConfig.Field('other', 3, 1)])
+        with self.assertRaises(ValueError):
+            PhastaConfig.ArrayDescriptor('solution', numpy.float64, False, [PhastaConfig.Field('velocity', -1, 3)])
+        with self.assertRaises(ValueError):
+            PhastaConfig([
+                PhastaConfig.ArrayDescriptor('a', numpy.float64, False, [PhastaConfig.Field('pressure', 0, 1)]),
+                PhastaConfig.ArrayDescriptor('b', numpy.float64, False, [PhastaConfig.Field('pressure', 0, 1)]),
+            ])
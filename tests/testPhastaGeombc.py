@@ -0,0 +1,74 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import os
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, PhastaRawFileWriter, readPhastaFile
+from CRIMSONSolver.SolverStudies.PhastaGeombc import readGeombc, readLocalToGlobalMap
+from CRIMSONSolver.SolverStudies.PhastaConfig import geombcConfig
+
+
+class TestGeombc(unittest.TestCase):
+    @classmethod
+    def setUp(cls):
+        randomState = numpy.random.RandomState(0)
+        cls.coordinates = randomState.rand(3, 100)
+        cls.interiorConnectivity = randomState.randint(1, 101, (4, 50)).astype(numpy.int32)
+        cls.boundaryConnectivity = randomState.randint(1, 101, (4, 20)).astype(numpy.int32)
+        cls.nbcCodes = randomState.randint(0, 10, (2, 20)).astype(numpy.int32)
+        cls.modeNumberMap = numpy.arange(201, 301, dtype=numpy.int32).reshape((1, 100))
+
+        _, cls.fileName = tempfile.mkstemp()
+        with open(cls.fileName, 'wb') as outFile:
+            rawWriter = PhastaRawFileWriter(outFile)
+            rawWriter.writeFileHeader()
+            rawWriter.writeHeader('number of nodes', 0, [100])
+            rawWriter.writeDataBlock('co-ordinates', cls.coordinates)
+            rawWriter.writeDataBlock('connectivity interior linear tetrahedron', cls.interiorConnectivity, [1, 4])
+            rawWriter.writeDataBlock('connectivity boundary linear tetrahedron', cls.boundaryConnectivity,
+                                     [1, 4, 3, 3, 1, 1])
+            rawWriter.writeDataBlock('nbc codes linear tetrahedron', cls.nbcCodes, [1, 4, 3, 3, 1])
+            rawWriter.writeDataBlock('mode number map', cls.modeNumberMap)
+
+    @classmethod
+    def tearDown(cls):
+        os.remove(cls.fileName)
+
+    def test_read(self):
+        for mmap in [True, False]:
+            geombc = readGeombc(self.fileName, mmap=mmap)
+            self.assertTrue(numpy.array_equal(geombc.coordinates, self.coordinates.transpose()))
+            self.assertListEqual(geombc.interiorConnectivity.keys(), ['linear tetrahedron'])
+            self.assertTrue(numpy.array_equal(geombc.interiorConnectivity['linear tetrahedron'],
+                                              self.interiorConnectivity.transpose()))
+            self.assertTrue(numpy.array_equal(geombc.boundaryConnectivity['linear tetrahedron'],
+                                              self.boundaryConnectivity.transpose()))
+            self.assertTrue(numpy.array_equal(geombc.boundaryFaceIds['linear tetrahedron'], self.nbcCodes[1]))
+            self.assertTrue(numpy.array_equal(geombc.localToGlobalMap, numpy.arange(200, 300)))
+
+        self.assertTrue(numpy.array_equal(readLocalToGlobalMap(self.fileName), numpy.arange(200, 300)))
+
+    def test_read_config(self):
+        with open(self.fileName, 'rb') as inFile:
+            fields = readPhastaFile(PhastaRawFileReader(inFile), geombcConfig)
+        self.assertTrue(numpy.array_equal(fields['coordinates'], self.coordinates))
+
+    def test_read_corrupt(self):
+        _, fileName = tempfile.mkstemp()
+        try:
+            with open(fileName, 'wb') as outFile:
+                rawWriter = PhastaRawFileWriter(outFile)
+                rawWriter.writeFileHeader()
+                # One value more than 100 elements of 3 components
+                data = numpy.zeros(301)
+                rawWriter.writeHeader('co-ordinates', data.nbytes + 1, [100, 3])
+                data.tofile(outFile)
+                outFile.write('\n')
+
+            self.assertRaises(RuntimeError, readGeombc, fileName)
+        finally:
+            os.remove(fileName)
@@ -0,0 +1,53 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, PhastaRawFileWriter, readPhastaFile, \
+    writePhastaFile
+from CRIMSONSolver.SolverStudies.PhastaPartitions import findPartitionFiles, mergePhastaPartitions
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig
+
+
+class TestPartitions(unittest.TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        with open(r'testData\restart.1300.0', 'rb') as inFile:
+            cls.fields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig, ['pressure', 'velocity'])
+
+        # Split the nodes into three overlapping partitions with shuffled local numbering
+        nNodes = cls.fields['pressure'].shape[1]
+        randomState = numpy.random.RandomState(0)
+        cls.maps = [randomState.permutation(numpy.arange(start, min(start + 5000, nNodes)))
+                    for start in xrange(0, nNodes, 4500)]
+
+        for partition, nodeMap in enumerate(cls.maps):
+            partitionFields = dict((name, data[:, nodeMap]) for name, data in cls.fields.iteritems())
+            with open(os.path.join(cls.tempDir, 'restart.1300.{0}'.format(partition + 1)), 'wb') as outFile:
+                rawWriter = PhastaRawFileWriter(outFile)
+                rawWriter.writeFileHeader()
+                writePhastaFile(rawWriter, restartConfig, partitionFields, timeStep=1300)
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def test_merge(self):
+        fileNames = findPartitionFiles(self.tempDir, 'restart', 1300)
+        self.assertListEqual([os.path.basename(x) for x in fileNames],
+                             ['restart.1300.{0}'.format(i + 1) for i in xrange(len(self.maps))])
+
+        for streaming in [False, True]:
+            merged = mergePhastaPartitions(fileNames, self.maps, restartConfig, ['pressure', 'velocity'],
+                                           streaming=streaming)
+            for name, data in self.fields.iteritems():
+                self.assertTrue(numpy.array_equal(merged[name], data))
+
+        with self.assertRaises(RuntimeError):
+            mergePhastaPartitions(fileNames, self.maps[::-1], restartConfig, ['pressure'])
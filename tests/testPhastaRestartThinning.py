@@ -0,0 +1,88 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, readPhastaFile, getIndexFileName
+from CRIMSONSolver.SolverStudies.PhastaRestartThinning import RetentionPolicy, thinRestarts, findRestartFiles
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig
+
+
+class TestRestartThinning(unittest.TestCase):
+    timeSteps = range(5, 105, 5)
+
+    @classmethod
+    def setUp(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        for timeStep in cls.timeSteps:
+            for partition in [1, 2]:
+                shutil.copy(r'testData\restart.1300.0',
+                            os.path.join(cls.tempDir, 'restart.{0}.{1}'.format(timeStep, partition)))
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def test_policy(self):
+        self.assertSetEqual(RetentionPolicy().selectRetainedSteps(self.timeSteps), set(self.timeSteps))
+        self.assertSetEqual(RetentionPolicy(everyNthStep=30).selectRetainedSteps(self.timeSteps), {30, 60, 90, 100})
+        self.assertSetEqual(RetentionPolicy(stepsPerCycle=40, lastCycles=1, keepLatest=False).selectRetainedSteps(
+            self.timeSteps), {65, 70, 75, 80, 85, 90, 95, 100})
+        # Cycles [0, 40), [40, 80), [80, 120) sampled at phases 0 and 20
+        self.assertSetEqual(RetentionPolicy(stepsPerCycle=40, phaseSamplesPerCycle=2).selectRetainedSteps(
+            self.timeSteps), {5, 20, 40, 60, 80, 100})
+        self.assertRaises(ValueError, RetentionPolicy, lastCycles=1)
+
+    def test_thin(self):
+        policy = RetentionPolicy(everyNthStep=50)
+        fileSize = os.path.getsize(os.path.join(self.tempDir, 'restart.5.1'))
+
+        report = thinRestarts(self.tempDir, policy, dryRun=True)
+        self.assertEqual(len(report.deletedFiles), 2 * (len(self.timeSteps) - 2))
+        self.assertEqual(report.reclaimedBytes, len(report.deletedFiles) * fileSize)
+        self.assertEqual(len(findRestartFiles(self.tempDir)), len(self.timeSteps))
+
+        report = thinRestarts(self.tempDir, policy, dropBlocks=['time derivative of solution'], maxWorkers=2)
+        self.assertListEqual(sorted(findRestartFiles(self.tempDir).keys()), [50, 100])
+        self.assertEqual(len(report.rewrittenFiles), 4)
+        self.assertGreater(report.reclaimedBytes, len(report.deletedFiles) * fileSize)
+
+        with open(r'testData\restart.1300.0', 'rb') as inFile:
+            originalFields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig)
+        with open(os.path.join(self.tempDir, 'restart.50.2'), 'rb') as inFile:
+            reader = PhastaRawFileReader(inFile)
+            self.assertNotIn('time derivative of solution', reader.blockDescriptors)
+            fields = readPhastaFile(reader, restartConfig)
+        for name, data in fields.iteritems():
+            self.assertTrue(numpy.array_equal(data, originalFields[name]))
+
+        self.assertRaises(ValueError, thinRestarts, self.tempDir, policy, dropBlocks=['solution'])
+
+    def test_thin_index_files(self):
+        policy = RetentionPolicy(everyNthStep=50)
+        fileSizes = {}
+        for fileNames in findRestartFiles(self.tempDir).itervalues():
+            for fileName in fileNames:
+                with open(fileName, 'rb') as inFile:
+                    PhastaRawFileReader(inFile, useIndex=True)
+                fileSizes[fileName] = os.path.getsize(fileName) + os.path.getsize(getIndexFileName(fileName))
+
+        report = thinRestarts(self.tempDir, policy, dryRun=True)
+        self.assertEqual(report.reclaimedBytes, sum(fileSizes[fileName] for fileName in report.deletedFiles))
+
+        report = thinRestarts(self.tempDir, policy)
+        self.assertEqual(report.reclaimedBytes, sum(fileSizes[fileName] for fileName in report.deletedFiles))
+        self.assertListEqual(sorted(os.listdir(self.tempDir)),
+                             sorted([os.path.basename(fileName) for fileName in report.keptFiles] +
+                                    [os.path.basename(getIndexFileName(fileName)) for fileName in report.keptFiles]))
+
+        # The stale indices of the rewritten files are removed
+        report = thinRestarts(self.tempDir, policy, dropBlocks=['time derivative of solution'])
+        self.assertEqual(len(report.rewrittenFiles), 4)
+        self.assertListEqual(sorted(os.listdir(self.tempDir)),
+                             sorted(os.path.basename(fileName) for fileName in report.keptFiles))
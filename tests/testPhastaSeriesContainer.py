@@ -0,0 +1,57 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, PhastaRawFileWriter, readPhastaFile, \
+    writePhastaFile
+from CRIMSONSolver.SolverStudies.PhastaSeriesContainer import PhastaSeriesContainer, packPhastaTimeSeries
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig
+
+
+class TestSeriesContainer(unittest.TestCase):
+    timeSteps = [100, 5, 10, 20, 15]
+
+    @classmethod
+    def setUp(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        with open(r'testData\restart.1300.0', 'rb') as inFile:
+            cls.fields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig, ['pressure', 'velocity'])
+
+        cls.fileNames = []
+        for timeStep in cls.timeSteps:
+            stepFields = dict((name, data * timeStep) for name, data in cls.fields.iteritems())
+            cls.fileNames.append(os.path.join(cls.tempDir, 'restart.{0}.1'.format(timeStep)))
+            with open(cls.fileNames[-1], 'wb') as outFile:
+                rawWriter = PhastaRawFileWriter(outFile)
+                rawWriter.writeFileHeader()
+                writePhastaFile(rawWriter, restartConfig, stepFields, timeStep=timeStep)
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def test_pack(self):
+        containerFileName = os.path.join(self.tempDir, 'restart.series')
+        packPhastaTimeSeries(self.fileNames, containerFileName, restartConfig, ['pressure', 'velocity'],
+                             stepChunk=2, maxWorkers=2)
+
+        with PhastaSeriesContainer(containerFileName) as container:
+            self.assertListEqual(list(container.timeSteps), sorted(self.timeSteps))
+            self.assertListEqual(container.fieldNames, ['pressure', 'velocity'])
+
+            nodes = [0, 3, container.nNodes - 1]
+            for name, data in self.fields.iteritems():
+                probe = container.probe(name, nodes)
+                self.assertTupleEqual(probe.shape, (len(self.timeSteps), data.shape[0], len(nodes)))
+                for stepIndex, timeStep in enumerate(container.timeSteps):
+                    self.assertTrue(numpy.array_equal(probe[stepIndex], data[:, nodes] * timeStep))
+                    self.assertTrue(numpy.array_equal(container.snapshot(name, timeStep), data * timeStep))
+
+            self.assertRaises(KeyError, container.snapshot, 'pressure', 7)
+            self.assertRaises(KeyError, container.probe, 'displacement', nodes)
@@ -0,0 +1,88 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import threading
+import os
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, readPhastaFile
+from CRIMSONSolver.SolverStudies.PhastaSolutionLoader import loadPhastaFiles, getReducedPrecisionDataTypes
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig, ybarConfig
+
+
+class TestSolutionLoader(unittest.TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        cls.fileNames = []
+        for timeStep in xrange(6):
+            cls.fileNames.append(os.path.join(cls.tempDir, 'restart.{0}.1'.format(timeStep)))
+            shutil.copy(r'testData\restart.1300.0', cls.fileNames[-1])
+        cls.fileNames.append(os.path.join(cls.tempDir, 'restart.missing.1'))
+
+        with open(r'testData\restart.1300.0', 'rb') as inFile:
+            cls.fields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig)
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def test_load(self):
+        progress = []
+
+        def reportProgress(nFilesLoaded, nFiles, nBytesLoaded, nBytes):
+            progress.append((nFilesLoaded, nFiles, nBytesLoaded, nBytes))
+
+        for eager in [False, True]:
+            del progress[:]
+            results = loadPhastaFiles(self.fileNames, [restartConfig] * len(self.fileNames), maxWorkers=3,
+                                      eager=eager, progressCallback=reportProgress)
+
+            self.assertListEqual([result.fileName for result in results], self.fileNames)
+            self.assertIsInstance(results[-1].error, IOError)
+            for result in results[:-1]:
+                self.assertIsNone(result.error)
+                self.assertListEqual(result.fields.keys()[:3], ['pressure', 'velocity', 'concentration'])
+                for name, data in self.fields.iteritems():
+                    fieldData = result.fields[name] if eager else result.fields[name].load()
+                    self.assertTrue(numpy.array_equal(fieldData, data.transpose()))
+                    self.assertTrue(fieldData.flags['C_CONTIGUOUS'] and fieldData.flags['OWNDATA'])
+
+            self.assertListEqual([p[0] for p in progress], range(1, len(self.fileNames) + 1))
+            self.assertEqual(progress[-1][2], progress[-1][3])
+
+    def test_reduced_precision(self):
+        storageDataTypes = getReducedPrecisionDataTypes([restartConfig, ybarConfig])
+        self.assertEqual(storageDataTypes['velocity'], numpy.float32)
+        self.assertEqual(storageDataTypes['ybar'], numpy.float32)
+        self.assertEqual(storageDataTypes['custom_error_indicator'], numpy.float16)
+
+        for eager in [False, True]:
+            results = loadPhastaFiles(self.fileNames[:2], [restartConfig] * 2, eager=eager,
+                                      storageDataTypes=storageDataTypes)
+            for result in results:
+                self.assertIsNone(result.error)
+                for name, data in self.fields.iteritems():
+                    fieldData = result.fields[name] if eager else result.fields[name].load()
+                    self.assertEqual(fieldData.dtype, numpy.float32)
+                    self.assertTrue(numpy.allclose(fieldData, data.transpose(), rtol=1e-6))
+
+    def test_cancel(self):
+        progress = []
+
+        def cancel(*args):
+            progress.append(args)
+            return False
+
+        # The callback is not called after the loading has been cancelled
+        loadPhastaFiles(self.fileNames, [restartConfig] * len(self.fileNames), progressCallback=cancel)
+        self.assertEqual(len(progress), 1)
+
+        cancelEvent = threading.Event()
+        cancelEvent.set()
+        results = loadPhastaFiles(self.fileNames, [restartConfig] * len(self.fileNames), cancelEvent=cancelEvent)
+        self.assertTrue(all(result.fields is None and result.error is None for result in results))
@@ -5,9 +5,12 @@ sys.modules['PythonQt'] = PythonQt
 
 import unittest
 import tempfile
+import shutil
+import os
 import numpy
-from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, PhastaRawFileWriter, readPhastaFile, \
-    writePhastaFile
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaIO, PhastaRawFileReader, PhastaRawFileWriter, readPhastaFile, \
+    writePhastaFile, getIndexFileName, patchPhastaFile, PhastaBlockCache, convertPhastaFileByteOrder, \
+    createPhastaFieldSources
 from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig, ybarConfig
 
 
@@ -82,6 +85,157 @@ class TestRawIO(unittest.TestCase):
                     rawData2 = rawReader2.getRawData(blockName)
                     self.assertTrue(numpy.allclose(rawData, rawData2))
 
+    def test_index(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'restart.1300.0')
+            shutil.copy(r'testData\restart.1300.0', fileName)
+
+            with open(fileName, 'rb') as inFile:
+                reader = PhastaRawFileReader(inFile, useIndex=True)
+                solution = reader.getDataBlock('solution', numpy.float64)
+            self.assertTrue(os.path.exists(getIndexFileName(fileName)))
+
+            with open(fileName, 'rb') as inFile:
+                indexedReader = PhastaRawFileReader(inFile, useIndex=True)
+                self.assertTrue(indexedReader.loadIndex())
+                self.assertEqual(reader.byteOrderCode, indexedReader.byteOrderCode)
+                self.assertSetEqual(set(reader.blockDescriptors.iterkeys()),
+                                    set(indexedReader.blockDescriptors.iterkeys()))
+                for blockName, blockDescriptor in reader.blockDescriptors.iteritems():
+                    indexedBlockDescriptor = indexedReader.getBlockDescriptor(blockName)
+                    self.assertEqual(blockDescriptor.posInFile, indexedBlockDescriptor.posInFile)
+                    self.assertEqual(blockDescriptor.totalBytes, indexedBlockDescriptor.totalBytes)
+                    self.assertListEqual(blockDescriptor.headerElements, indexedBlockDescriptor.headerElements)
+                self.assertTrue(numpy.array_equal(solution, indexedReader.getDataBlock('solution', numpy.float64)))
+
+            # Changing the file invalidates the index
+            with open(fileName, 'ab') as outFile:
+                outFile.write('extra : < 0 > 0\n')
+
+            with open(fileName, 'rb') as inFile:
+                self.assertFalse(PhastaRawFileReader(inFile).loadIndex())
+                inFile.seek(0)
+                self.assertIn('extra', PhastaRawFileReader(inFile, useIndex=True).blockDescriptors)
+
+            # File objects without a usable file name fall back to scanning the headers
+            with os.fdopen(os.open(fileName, os.O_RDONLY), 'rb') as inFile:
+                self.assertIn('extra', PhastaRawFileReader(inFile, useIndex=True).blockDescriptors)
+                self.assertFalse(os.path.exists(getIndexFileName(inFile.name)))
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_header_errors(self):
+        _, tempFName = tempfile.mkstemp()
+        try:
+            with open(r'testData\restart.1300.0', 'rb') as inFile:
+                head = inFile.read(1000)
+
+            # Truncated data block
+            with open(tempFName, 'wb') as tempFile:
+                tempFile.write(head)
+            with open(tempFName, 'rb') as tempFile:
+                with self.assertRaisesRegexp(IOError, 'solution.*at byte offset 213'):
+                    PhastaRawFileReader(tempFile)
+
+            # Malformed header
+            with open(tempFName, 'wb') as tempFile:
+                tempFile.write(head[:213] + 'solution : 495401 12385 5 1300\n')
+            with open(tempFName, 'rb') as tempFile:
+                with self.assertRaisesRegexp(IOError, 'byte offset 213'):
+                    PhastaRawFileReader(tempFile)
+        finally:
+            os.remove(tempFName)
+
+    def test_swapped_byte_order(self):
+        with open(r'testData\restart.1300.0', 'rb') as inFile:
+            solution = PhastaRawFileReader(inFile).getNativeDataBlock('solution', numpy.float64)
+
+        swappedByteOrder = solution.dtype.newbyteorder().byteorder
+        _, tempFName = tempfile.mkstemp()
+        try:
+            with open(tempFName, 'wb') as tempFile:
+                rawWriter = PhastaRawFileWriter(tempFile)
+                magicNumber = numpy.array([PhastaIO.ByteOrderMagicNumber], numpy.int32).byteswap()
+                rawWriter.writeRawData('byteorder magic number', magicNumber.view(numpy.byte), [1])
+                rawWriter.writeRawData('solution', solution.byteswap().view(numpy.byte).ravel(),
+                                       list(solution.shape[::-1]) + [1300])
+
+            for mmap in [False, True]:
+                with open(tempFName, 'rb') as tempFile:
+                    reader = PhastaRawFileReader(tempFile, mmap=mmap)
+                    self.assertEqual(reader.byteOrderCode, swappedByteOrder)
+                    self.assertFalse(reader.getDataBlock('solution', numpy.float64).dtype.isnative)
+
+                    velocity = reader.getDataBlockComponents('solution', numpy.float64, 1, 3)
+                    self.assertTrue(velocity.dtype.isnative)
+                    self.assertTrue(numpy.array_equal(velocity, solution[1:4]))
+
+                    nativeSolution = reader.getNativeDataBlock('solution', numpy.float64)
+                    self.assertTrue(nativeSolution.dtype.isnative)
+                    self.assertTrue(nativeSolution.flags['C_CONTIGUOUS'])
+                    self.assertTrue(numpy.array_equal(nativeSolution, solution))
+                    self.assertIs(reader.getNativeDataBlock('solution', numpy.float64), nativeSolution)
+        finally:
+            os.remove(tempFName)
+
+    def test_cache(self):
+        blockBytes = 12385 * 5 * 8
+        cache = PhastaBlockCache(maxBytes=2 * blockBytes + 4)
+
+        with open(r'testData\restart.1300.0', 'rb') as inFile:
+            reader = PhastaRawFileReader(inFile, cache=cache)
+            self.assertIs(reader.cache, cache)
+            self.assertEqual((cache.hits, cache.misses, cache.evictions), (0, 1, 0))  # byte order magic number
+
+            reader.getRawData('solution')
+            reader.getRawData('solution')
+            reader.getRawData('time derivative of solution')
+            self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 3, 0))
+            self.assertEqual(cache.totalBytes, 2 * blockBytes + 4)
+
+            # Evicts the least recently used byte order magic number and solution
+            reader.getRawData('boundary fluxes')
+            self.assertEqual(cache.evictions, 2)
+            self.assertLessEqual(cache.totalBytes, cache.maxBytes)
+
+            # Another reader of the same file shares the cached data
+            inFile.seek(0)
+            reader2 = PhastaRawFileReader(inFile, cache=cache)
+            self.assertIs(reader2.getRawData('boundary fluxes'), reader.getRawData('boundary fluxes'))
+
+            # Data larger than the cache is not cached
+            smallCache = PhastaBlockCache(maxBytes=blockBytes - 1)
+            inFile.seek(0)
+            PhastaRawFileReader(inFile, cache=smallCache).getRawData('solution')
+            self.assertEqual(smallCache.totalBytes, 4)
+
+    def test_write_chunks(self):
+        data = numpy.arange(3 * 1000, dtype=numpy.float64).reshape((3, 1000))
+        _, tempFName = tempfile.mkstemp()
+        try:
+            with open(tempFName, 'wb') as tempFile:
+                rawWriter = PhastaRawFileWriter(tempFile)
+                rawWriter.writeFileHeader()
+                # Chunks spanning several components, converted from int
+                flat = data.astype(numpy.int64).ravel()
+                rawWriter.writeDataBlockChunks('components', (flat[i:i + 700] for i in xrange(0, flat.size, 700)),
+                                               3, 1000, numpy.float64, [5])
+                rawWriter.writeDataBlockChunks('elements', (data[:, i:i + 300] for i in xrange(0, 1000, 300)),
+                                               3, 1000, numpy.float64, elementChunks=True)
+                endPos = tempFile.tell()
+                with self.assertRaises(IndexError):
+                    rawWriter.writeDataBlockChunks('incomplete', [data[0]], 3, 1000, numpy.float64)
+                tempFile.truncate(endPos)
+
+            with open(tempFName, 'rb') as tempFile:
+                reader = PhastaRawFileReader(tempFile)
+                self.assertListEqual(reader.getBlockDescriptor('components').headerElements, [1000, 3, 5])
+                self.assertTrue(numpy.array_equal(reader.getDataBlock('components', numpy.float64), data))
+                self.assertTrue(numpy.array_equal(reader.getDataBlock('elements', numpy.float64), data))
+        finally:
+            os.remove(tempFName)
+
     def test_wrong_openmode(self):
         with self.assertRaises(IOError):
             PhastaRawFileReader(open(TestRawIO.fileName, 'rt'))
@@ -130,6 +284,31 @@ class TestConfigIO(unittest.TestCase):
             else:
                 self.assertEqual(elementCount[arrayDesc], fieldArray.shape[1])
 
+    def test_read_mmap(self):
+        fields1 = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
+        TestConfigIO.inFile.seek(0)
+        fields2 = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile, mmap=True), TestConfigIO.config)
+
+        self.assertSetEqual(set(fields1.iterkeys()), set(fields2.iterkeys()))
+        for name, field1 in fields1.iteritems():
+            self.assertEqual(field1.dtype, fields2[name].dtype)
+            self.assertTrue(numpy.array_equal(field1, fields2[name]))
+
+    def test_read_selected_fields(self):
+        allFields = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
+
+        for mmap in [False, True]:
+            TestConfigIO.inFile.seek(0)
+            fields = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile, mmap=mmap), TestConfigIO.config,
+                                    fields=['pressure', 'velocity'])
+            self.assertSetEqual(set(fields.iterkeys()), {'pressure', 'velocity'})
+            for name, field in fields.iteritems():
+                self.assertTrue(numpy.array_equal(field, allFields[name]))
+
+        TestConfigIO.inFile.seek(0)
+        with self.assertRaises(KeyError):
+            readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config, fields=['UNKNOWN'])
+
     def test_read_write(self):
         fields1 = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
         _, tempFName = tempfile.mkstemp()
@@ -147,3 +326,240 @@ class TestConfigIO(unittest.TestCase):
             self.assertEqual(field1.dtype, field2.dtype)
             self.assertEqual(field1.shape, field2.shape)
             self.assertTrue(numpy.allclose(field1, field2))
+
+    def test_write_partial_fields(self):
+        fields1 = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
+        # Non-contiguous field data, as produced by transposing SolutionStorage arrays
+        velocity = numpy.ascontiguousarray(fields1['velocity'].transpose()).transpose()
+        self.assertFalse(velocity.flags['C_CONTIGUOUS'])
+        _, tempFName = tempfile.mkstemp()
+
+        with open(tempFName, 'wb') as tempFile:
+            writePhastaFile(PhastaRawFileWriter(tempFile), TestConfigIO.config, {'velocity': velocity})
+
+        with open(tempFName, 'rb') as tempFile:
+            fields2 = readPhastaFile(PhastaRawFileReader(tempFile), TestConfigIO.config)
+
+        self.assertTrue(numpy.array_equal(fields1['velocity'], fields2['velocity']))
+        self.assertFalse(fields2['pressure'].any())
+        self.assertFalse(fields2['concentration'].any())
+        self.assertNotIn('pressure derivative', fields2)
+        os.remove(tempFName)
+
+    def test_patch(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'restart.0.1')
+            shutil.copy(r'testData\restart.1300.0', fileName)
+            fileSize = os.path.getsize(fileName)
+            fields1 = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
+
+            # Same-sized data block is overwritten in place, the components not provided are zeroed
+            pressure = fields1['pressure'] * 2
+            patchPhastaFile(fileName, TestConfigIO.config, {'pressure': pressure})
+            self.assertEqual(os.path.getsize(fileName), fileSize)
+            with open(fileName, 'rb') as inFile:
+                fields2 = readPhastaFile(PhastaRawFileReader(inFile), TestConfigIO.config)
+            self.assertTrue(numpy.array_equal(fields2['pressure'], pressure))
+            self.assertFalse(fields2['velocity'].any())
+
+            patchPhastaFile(fileName, TestConfigIO.config, {'pressure': pressure, 'velocity': fields1['velocity']})
+            with open(fileName, 'rb') as inFile:
+                fields2 = readPhastaFile(PhastaRawFileReader(inFile), TestConfigIO.config)
+            self.assertTrue(numpy.array_equal(fields2['velocity'], fields1['velocity']))
+
+            # New data block is appended
+            displacement = numpy.ones((3, pressure.shape[1]))
+            patchPhastaFile(fileName, TestConfigIO.config, {'displacement': displacement})
+            with open(fileName, 'rb') as inFile:
+                fields2 = readPhastaFile(PhastaRawFileReader(inFile), TestConfigIO.config)
+            self.assertTrue(numpy.array_equal(fields2['displacement'], displacement))
+            self.assertTrue(numpy.array_equal(fields2['pressure'], pressure))
+
+            # Data block of different size causes the rewrite of the file tail, the components not provided are zeroed
+            velocity = numpy.ones((3, 10))
+            patchPhastaFile(fileName, TestConfigIO.config, {'velocity': velocity})
+            with open(fileName, 'rb') as inFile:
+                fields2 = readPhastaFile(PhastaRawFileReader(inFile), TestConfigIO.config)
+            self.assertTrue(numpy.array_equal(fields2['velocity'], velocity))
+            self.assertFalse(fields2['pressure'].any())
+            self.assertTrue(numpy.array_equal(fields2['displacement'], displacement))
+            self.assertListEqual(os.listdir(tempDir), ['restart.0.1'])
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_patch_mixed(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'restart.0.1')
+            shutil.copy(r'testData\restart.1300.0', fileName)
+            fields1 = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
+
+            def readHeaders():
+                with open(fileName, 'rb') as inFile:
+                    rawReader = PhastaRawFileReader(inFile)
+                    return dict((name, d.headerElements) for name, d in rawReader.blockDescriptors.iteritems())
+
+            # New data block gets the time step of the existing ones
+            displacement = numpy.ones((3, fields1['pressure'].shape[1]))
+            patchPhastaFile(fileName, TestConfigIO.config, {'displacement': displacement})
+            self.assertEqual(readHeaders()['displacement'][-1], 1300)
+
+            # A failed rewrite leaves the original file untouched
+            pressure = fields1['pressure'] * 3
+            displacement = numpy.ones((3, 10))
+            with open(fileName, 'rb') as inFile:
+                originalContents = inFile.read()
+
+            module = sys.modules[patchPhastaFile.__module__]
+            originalReplaceFile = module.replaceFile
+
+            def failingReplaceFile(src, dst):
+                raise OSError('Simulated failure')
+
+            module.replaceFile = failingReplaceFile
+            try:
+                self.assertRaises(OSError, patchPhastaFile, fileName, TestConfigIO.config,
+                                  {'pressure': pressure, 'displacement': displacement})
+            finally:
+                module.replaceFile = originalReplaceFile
+            with open(fileName, 'rb') as inFile:
+                self.assertEqual(inFile.read(), originalContents)
+            self.assertListEqual(os.listdir(tempDir), ['restart.0.1'])
+
+            # Same-sized and resized data blocks are both rewritten, keeping the time steps
+            patchPhastaFile(fileName, TestConfigIO.config, {'pressure': pressure, 'displacement': displacement})
+            with open(fileName, 'rb') as inFile:
+                fields2 = readPhastaFile(PhastaRawFileReader(inFile), TestConfigIO.config)
+            self.assertTrue(numpy.array_equal(fields2['pressure'], pressure))
+            self.assertFalse(fields2['velocity'].any())
+            self.assertTrue(numpy.array_equal(fields2['displacement'], displacement))
+            headers = readHeaders()
+            self.assertListEqual(headers['solution'], [fields1['pressure'].shape[1], 5, 1300])
+            self.assertListEqual(headers['displacement'], [10, 3, 1300])
+
+            # Explicit time step replaces the one in the headers
+            patchPhastaFile(fileName, TestConfigIO.config, {'pressure': pressure}, timeStep=7)
+            with open(fileName, 'rb') as inFile:
+                fields2 = readPhastaFile(PhastaRawFileReader(inFile), TestConfigIO.config)
+            self.assertTrue(numpy.array_equal(fields2['pressure'], pressure))
+            self.assertTrue(numpy.array_equal(fields2['displacement'], displacement))
+            headers = readHeaders()
+            self.assertEqual(headers['solution'][-1], 7)
+            self.assertEqual(headers['displacement'][-1], 1300)
+            self.assertListEqual(os.listdir(tempDir), ['restart.0.1'])
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_write_byte_order(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fields1 = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
+            swappedByteOrder = sys.byteorder == 'little' and '>' or '<'
+
+            # Write in the non-native byte order with small conversion chunks
+            fileName = os.path.join(tempDir, 'restart.0.1')
+            chunkBytes = PhastaRawFileWriter.ConversionChunkBytes
+            PhastaRawFileWriter.ConversionChunkBytes = 1000
+            try:
+                with open(fileName, 'wb') as outFile:
+                    rawWriter = PhastaRawFileWriter(outFile, byteOrder=swappedByteOrder)
+                    rawWriter.writeFileHeader()
+                    writePhastaFile(rawWriter, TestConfigIO.config, fields1)
+            finally:
+                PhastaRawFileWriter.ConversionChunkBytes = chunkBytes
+
+            with open(fileName, 'rb') as inFile:
+                reader = PhastaRawFileReader(inFile)
+                self.assertEqual(reader.byteOrderCode, swappedByteOrder)
+                fields2 = readPhastaFile(reader, TestConfigIO.config)
+            for name, data in fields1.iteritems():
+                self.assertTrue(numpy.array_equal(fields2[name], data))
+
+            # Appending to a non-native file keeps its byte order
+            displacement = numpy.ones((3, fields1['pressure'].shape[1]))
+            patchPhastaFile(fileName, TestConfigIO.config, {'displacement': displacement})
+            with open(fileName, 'rb') as inFile:
+                fields2 = readPhastaFile(PhastaRawFileReader(inFile), TestConfigIO.config)
+            self.assertTrue(numpy.array_equal(fields2['displacement'], displacement))
+
+            # Converting back to the native byte order
+            nativeFileName = os.path.join(tempDir, 'restart.0.2')
+            convertPhastaFileByteOrder(fileName, nativeFileName, '=')
+            with open(nativeFileName, 'rb') as inFile:
+                reader = PhastaRawFileReader(inFile)
+                self.assertEqual(reader.byteOrderCode, '=')
+                fields2 = readPhastaFile(reader, TestConfigIO.config)
+            self.assertTrue(numpy.array_equal(fields2['displacement'], displacement))
+            for name, data in fields1.iteritems():
+                self.assertTrue(numpy.array_equal(fields2[name], data))
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_field_sources(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'restart.0.1')
+            shutil.copy(r'testData\restart.1300.0', fileName)
+            fields = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
+
+            sources = createPhastaFieldSources(fileName, TestConfigIO.config)
+            self.assertListEqual(sorted(sources.keys()), sorted(fields.keys()))
+            for name, data in fields.iteritems():
+                self.assertTupleEqual(sources[name].shape, data.transpose().shape)
+                self.assertTrue(numpy.array_equal(sources[name].load(), data.transpose()))
+
+            # The sources use the layout read by createPhastaFieldSources(), the headers are not read again
+            module = sys.modules[createPhastaFieldSources.__module__]
+            originalReader = module.PhastaRawFileReader
+
+            def failingReader(*args, **kwargs):
+                raise AssertionError('The headers are read again')
+
+            module.PhastaRawFileReader = failingReader
+            try:
+                self.assertTrue(numpy.array_equal(sources['velocity'].load(), fields['velocity'].transpose()))
+            finally:
+                module.PhastaRawFileReader = originalReader
+
+            # The loaded data does not refer to the file, which can then be rewritten
+            pressure = sources['pressure'].load()
+            self.assertTrue(pressure.flags['OWNDATA'])
+            with open(fileName, 'r+b') as outFile:
+                outFile.truncate(0)
+            self.assertTrue(numpy.array_equal(pressure, fields['pressure'].transpose()))
+            shutil.copy(r'testData\restart.1300.0', fileName)
+            sources = createPhastaFieldSources(fileName, TestConfigIO.config)
+
+            patchPhastaFile(fileName, TestConfigIO.config, {'pressure': fields['pressure'] * 2})
+            os.utime(fileName, (0, 0))
+            self.assertRaises(IOError, sources['pressure'].load)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_reduced_precision(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'restart.0.1')
+            shutil.copy(r'testData\restart.1300.0', fileName)
+            fields = readPhastaFile(PhastaRawFileReader(TestConfigIO.inFile), TestConfigIO.config)
+
+            sources = createPhastaFieldSources(fileName, TestConfigIO.config, {'velocity': numpy.float32})
+            self.assertEqual(sources['velocity'].dtype, numpy.float32)
+            self.assertEqual(sources['pressure'].dtype, numpy.float64)
+            velocity = sources['velocity'].load()
+            self.assertEqual(velocity.dtype, numpy.float32)
+            self.assertTrue(velocity.flags['C_CONTIGUOUS'])
+            self.assertTrue(numpy.allclose(velocity, fields['velocity'].transpose(), rtol=1e-6))
+
+            # Reduced-precision fields are written back with the data type of the data block
+            patchPhastaFile(fileName, TestConfigIO.config, {'velocity': velocity.transpose()})
+            with open(fileName, 'rb') as inFile:
+                fields2 = readPhastaFile(PhastaRawFileReader(inFile), TestConfigIO.config)
+            self.assertEqual(fields2['velocity'].dtype, numpy.float64)
+            self.assertTrue(numpy.array_equal(fields2['velocity'], velocity.transpose()))
+
+            with self.assertRaises(IndexError):
+                patchPhastaFile(fileName, TestConfigIO.config, {'velocity': fields['velocity'].astype(numpy.int64)})
+        finally:
+            shutil.rmtree(tempDir)
@@ -0,0 +1,75 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, PhastaRawFileWriter, readPhastaFile, \
+    writePhastaFile
+from CRIMSONSolver.SolverStudies.PhastaStatistics import RunningStatistics, accumulatePhastaStatistics
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig, ybarAllComponentsConfig
+
+
+class TestStatistics(unittest.TestCase):
+    def test_running_statistics(self):
+        data = numpy.random.RandomState(0).rand(20, 3, 100) * 1e3 + 1e6
+        statistics = RunningStatistics()
+        self.assertIsNone(statistics.getVariance())
+        for step in data:
+            statistics.update(step)
+
+        self.assertEqual(statistics.count, 20)
+        self.assertTrue(numpy.allclose(statistics.mean, data.mean(axis=0), rtol=0, atol=1e-6))
+        self.assertTrue(numpy.allclose(statistics.getVariance(), data.var(axis=0)))
+        self.assertTrue(numpy.allclose(statistics.getVariance(ddof=1), data.var(axis=0, ddof=1)))
+        self.assertTrue(numpy.array_equal(statistics.min, data.min(axis=0)))
+        self.assertTrue(numpy.array_equal(statistics.max, data.max(axis=0)))
+        self.assertRaises(ValueError, statistics.update, data[0, :2])
+
+    def test_accumulate(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            with open(r'testData\restart.1300.0', 'rb') as inFile:
+                fields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig, ['pressure', 'velocity'])
+
+            factors = [1, 3, 2]
+            fileNames = []
+            for i, factor in enumerate(factors):
+                fileNames.append(os.path.join(tempDir, 'restart.{0}.1'.format(i)))
+                with open(fileNames[-1], 'wb') as outFile:
+                    rawWriter = PhastaRawFileWriter(outFile)
+                    rawWriter.writeFileHeader()
+                    writePhastaFile(rawWriter, restartConfig,
+                                    dict((name, data * factor) for name, data in fields.iteritems()))
+
+            statistics = accumulatePhastaStatistics(fileNames, restartConfig, ['pressure', 'velocity'])
+            for name, data in fields.iteritems():
+                self.assertEqual(statistics[name].count, 3)
+                self.assertTrue(numpy.allclose(statistics[name].mean, data * 2))
+                self.assertTrue(numpy.allclose(statistics[name].getVariance(), data ** 2 * 2 / 3.0))
+                self.assertTrue(numpy.array_equal(statistics[name].max, numpy.maximum(data, data * 3)))
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_accumulate_ybar(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            ybar = numpy.random.RandomState(0).rand(5, 100)
+            fileNames = []
+            for i in xrange(4):
+                fileNames.append(os.path.join(tempDir, 'ybar.{0}.1'.format(i)))
+                with open(fileNames[-1], 'wb') as outFile:
+                    rawWriter = PhastaRawFileWriter(outFile)
+                    rawWriter.writeFileHeader()
+                    writePhastaFile(rawWriter, ybarAllComponentsConfig, {'ybar components': ybar * i}, timeStep=i)
+
+            statistics = accumulatePhastaStatistics(fileNames, ybarAllComponentsConfig, ['ybar components'])
+            self.assertEqual(statistics['ybar components'].count, 4)
+            self.assertTrue(numpy.allclose(statistics['ybar components'].mean, ybar * 1.5))
+            self.assertTrue(numpy.array_equal(statistics['ybar components'].max, ybar * 3))
+        finally:
+            shutil.rmtree(tempDir)
@@ -0,0 +1,143 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import os
+import time
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, PhastaRawFileWriter, readPhastaFile, \
+    writePhastaFile, convertPhastaFileByteOrder
+from CRIMSONSolver.SolverStudies.PhastaTimeSeries import findPhastaFiles, readPhastaTimeSeries, \
+    iterPhastaFiles
+from CRIMSONSolver.SolverStudies.PhastaConfig import PhastaConfig, restartConfig
+
+
+class TestTimeSeries(unittest.TestCase):
+    timeSteps = [100, 5, 10]
+
+    @classmethod
+    def setUp(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        with open(r'testData\restart.1300.0', 'rb') as inFile:
+            cls.fields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig, ['pressure', 'velocity'])
+
+        for timeStep in cls.timeSteps:
+            stepFields = dict((name, data * timeStep) for name, data in cls.fields.iteritems())
+            with open(os.path.join(cls.tempDir, 'restart.{0}.1'.format(timeStep)), 'wb') as outFile:
+                rawWriter = PhastaRawFileWriter(outFile)
+                rawWriter.writeFileHeader()
+                writePhastaFile(rawWriter, restartConfig, stepFields, timeStep=timeStep)
+
+        open(os.path.join(cls.tempDir, 'restart.7.2'), 'wb').close()
+        open(os.path.join(cls.tempDir, 'ybar.7.1'), 'wb').close()
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def test_find(self):
+        files = findPhastaFiles(self.tempDir)
+        self.assertListEqual([timeStep for timeStep, _ in files], sorted(self.timeSteps))
+        self.assertEqual(os.path.basename(files[0][1]), 'restart.5.1')
+
+        files = findPhastaFiles(self.tempDir, firstStep=6, lastStep=100)
+        self.assertListEqual([timeStep for timeStep, _ in files], [10, 100])
+
+    def test_read(self):
+        # Pass the files in the wrong order to check that the steps are ordered by the header time step
+        fileNames = [os.path.join(self.tempDir, 'restart.{0}.1'.format(timeStep)) for timeStep in self.timeSteps]
+        timeSteps, series = readPhastaTimeSeries(fileNames, restartConfig, ['pressure', 'velocity'], maxWorkers=2)
+
+        self.assertListEqual(list(timeSteps), sorted(self.timeSteps))
+        for name, data in self.fields.iteritems():
+            self.assertTupleEqual(series[name].shape, (len(self.timeSteps),) + data.shape)
+            for stepIndex, timeStep in enumerate(timeSteps):
+                self.assertTrue(numpy.array_equal(series[name][stepIndex], data * timeStep))
+
+    def test_read_swapped_byte_order(self):
+        fileNames = []
+        for timeStep in self.timeSteps:
+            fileNames.append(os.path.join(self.tempDir, 'swapped.{0}.1'.format(timeStep)))
+            convertPhastaFileByteOrder(os.path.join(self.tempDir, 'restart.{0}.1'.format(timeStep)), fileNames[-1],
+                                       '>' if sys.byteorder == 'little' else '<')
+
+        timeSteps, series = readPhastaTimeSeries(fileNames, restartConfig, ['velocity'])
+        self.assertListEqual(list(timeSteps), sorted(self.timeSteps))
+        for stepIndex, timeStep in enumerate(timeSteps):
+            self.assertTrue(numpy.array_equal(series['velocity'][stepIndex], self.fields['velocity'] * timeStep))
+
+    def test_read_single_component(self):
+        errorIndicator = self.fields['pressure']
+        fileNames = []
+        for timeStep in self.timeSteps:
+            for prefix, headerTimeStep in [('withStep', [timeStep]), ('withoutStep', None)]:
+                fileName = os.path.join(self.tempDir, '{0}.{1}.1'.format(prefix, timeStep))
+                with open(fileName, 'wb') as outFile:
+                    rawWriter = PhastaRawFileWriter(outFile)
+                    rawWriter.writeFileHeader()
+                    rawWriter.writeDataBlock('custom_error_indicator', errorIndicator * timeStep, headerTimeStep)
+                fileNames.append(fileName)
+
+        # The time step is taken from the header 'nNodes timeStep' or, if missing, from the file name
+        for prefix in ['withStep', 'withoutStep']:
+            timeSteps, series = readPhastaTimeSeries(
+                [fileName for fileName in fileNames if os.path.basename(fileName).startswith(prefix + '.')],
+                restartConfig, ['custom_error_indicator'])
+            self.assertListEqual(list(timeSteps), sorted(self.timeSteps))
+            for stepIndex, timeStep in enumerate(timeSteps):
+                self.assertTrue(numpy.array_equal(series['custom_error_indicator'][stepIndex],
+                                                  errorIndicator * timeStep))
+
+    def test_iterate(self):
+        fileNames = [os.path.join(self.tempDir, 'restart.{0}.1'.format(timeStep)) for timeStep in self.timeSteps]
+        stepBytes = sum(data.nbytes for data in self.fields.itervalues())
+
+        for prefetch, maxBytes in [(2, None), (3, stepBytes)]:
+            iteratedFileNames = []
+            for (fileName, fields), timeStep in zip(
+                    iterPhastaFiles(fileNames, restartConfig, ['pressure', 'velocity'], prefetch, maxBytes),
+                    self.timeSteps):
+                iteratedFileNames.append(fileName)
+                for name, data in self.fields.iteritems():
+                    self.assertTrue(numpy.array_equal(fields[name], data * timeStep))
+            self.assertListEqual(iteratedFileNames, fileNames)
+
+        # The files read ahead never exceed maxBytes: with one file taken by the caller and one read ahead,
+        # the next file is not read until the caller takes the file read ahead
+        PhastaTimeSeries = sys.modules[iterPhastaFiles.__module__]
+        readFileNames = []
+        originalReadPhastaFile = PhastaTimeSeries.readPhastaFile
+
+        def countingReadPhastaFile(rawReader, *args):
+            readFileNames.append(rawReader.file.name)
+            return originalReadPhastaFile(rawReader, *args)
+
+        # Without the list of fields, the whole 'solution' data block is read, not only the configured pressure
+        pressureConfig = PhastaConfig([PhastaConfig.ArrayDescriptor('solution', numpy.float64, False,
+                                                                    [PhastaConfig.Field('pressure', 0, 1)])])
+        solutionBytes = self.fields['pressure'].nbytes * 5
+
+        PhastaTimeSeries.readPhastaFile = countingReadPhastaFile
+        try:
+            for config, fields, maxBytes in [(restartConfig, ['pressure', 'velocity'], stepBytes),
+                                             (pressureConfig, None, solutionBytes)]:
+                del readFileNames[:]
+                iterator = iterPhastaFiles(fileNames, config, fields, prefetch=3, maxBytes=maxBytes)
+                next(iterator)
+                time.sleep(0.2)
+                self.assertListEqual(readFileNames, fileNames[:2])
+                iterator.close()
+        finally:
+            PhastaTimeSeries.readPhastaFile = originalReadPhastaFile
+
+        # Stopping the iteration early must stop the background reading
+        iterator = iterPhastaFiles(fileNames, restartConfig, ['pressure'], prefetch=1)
+        next(iterator)
+        iterator.close()
+
+        iterator = iterPhastaFiles(fileNames + [os.path.join(self.tempDir, 'restart.7.2')], restartConfig, ['pressure'])
+        self.assertRaises(KeyError, list, iterator)
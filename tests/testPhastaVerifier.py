@@ -0,0 +1,78 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, PhastaRawFileWriter, readPhastaFile, \
+    writePhastaFile
+from CRIMSONSolver.SolverStudies.PhastaVerifier import verifyPhastaFiles, writeManifest, formatVerificationReport
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig
+
+
+class TestVerifier(unittest.TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        with open(r'testData\restart.1300.0', 'rb') as inFile:
+            fields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig)
+
+        cls.goodFileName = os.path.join(cls.tempDir, 'restart.1.1')
+        cls.nanFileName = os.path.join(cls.tempDir, 'restart.2.1')
+        cls.truncatedFileName = os.path.join(cls.tempDir, 'restart.3.1')
+
+        fields['pressure'] = numpy.array(fields['pressure'])
+        for fileName in [cls.goodFileName, cls.nanFileName]:
+            if fileName == cls.nanFileName:
+                fields['pressure'][0, :3] = [numpy.nan, numpy.inf, -numpy.inf]
+            with open(fileName, 'wb') as outFile:
+                rawWriter = PhastaRawFileWriter(outFile)
+                rawWriter.writeFileHeader()
+                writePhastaFile(rawWriter, restartConfig, fields)
+
+        with open(cls.goodFileName, 'rb') as inFile, open(cls.truncatedFileName, 'wb') as outFile:
+            outFile.write(inFile.read()[:-100])
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def test_verify(self):
+        fileNames = [self.goodFileName, self.nanFileName, self.truncatedFileName]
+        for maxWorkers in [1, 2]:
+            good, nan, truncated = verifyPhastaFiles(fileNames, restartConfig, maxWorkers=maxWorkers)
+
+            self.assertTrue(good.ok)
+            self.assertEqual(good.nonFiniteCounts['pressure'], (0, 0))
+            self.assertFalse(nan.ok)
+            self.assertListEqual(nan.errors, [])
+            self.assertEqual(nan.nonFiniteCounts['pressure'], (1, 2))
+            self.assertFalse(truncated.ok)
+            self.assertEqual(len(truncated.errors), 1)
+
+        self.assertIn('2 failed', formatVerificationReport([good, nan, truncated]))
+
+    def test_manifest(self):
+        manifestFileName = os.path.join(self.tempDir, 'manifest.json')
+        writeManifest([self.goodFileName, self.nanFileName], manifestFileName, maxWorkers=1)
+
+        good, nan = verifyPhastaFiles([self.goodFileName, self.nanFileName], manifestFileName=manifestFileName)
+        self.assertTrue(good.ok)
+        self.assertIsNotNone(good.checksum)
+
+        with open(self.goodFileName, 'r+b') as outFile:
+            outFile.seek(-10, 2)
+            outFile.write('X')
+        good, truncated = verifyPhastaFiles([self.goodFileName, self.truncatedFileName],
+                                            manifestFileName=manifestFileName, maxWorkers=1)
+        self.assertIn('Checksum mismatch', good.errors[0])
+        self.assertIn('not listed', truncated.errors[-1])
+
+    def test_verify_header_only_blocks(self):
+        result, = verifyPhastaFiles([r'testData\restart.1300.0'], restartConfig, maxWorkers=1)
+        self.assertListEqual(result.errors, [])
+        self.assertTrue(result.ok)
@@ -0,0 +1,199 @@
+import PythonQtMock as PythonQt
+import sys
+
+sys.modules['PythonQt'] = PythonQt
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+from collections import OrderedDict
+from PythonQt.CRIMSON import ArrayDataType
+from CRIMSONCore.SolutionStorage import SolutionStorage, _ArrayTable
+from CRIMSONSolver.SolverStudies.PhastaSolverIO import PhastaRawFileReader, readPhastaFile, patchPhastaFile, \
+    createPhastaFieldSources
+from CRIMSONSolver.SolverStudies.PhastaConfig import restartConfig
+
+
+class _Source(object):
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = data.dtype
+
+    def load(self):
+        return self.data
+
+
+class TestSolutionStorage(unittest.TestCase):
+    def test_array_table(self):
+        table = _ArrayTable([('b', 1), ('a', 2)])
+        self.assertListEqual([table.keyAt(i) for i in xrange(len(table))], ['b', 'a'])
+
+        # The index is rebuilt after the keys have changed, but not after a value has been replaced
+        table['c'] = 3
+        self.assertEqual(table.keyAt(2), 'c')
+        keys = table._keys
+        table['a'] = 4
+        self.assertIs(table._keys, keys)
+        del table['b']
+        self.assertListEqual([table.keyAt(i) for i in xrange(len(table))], ['a', 'c'])
+        table.pop('a')
+        self.assertEqual(table.keyAt(0), 'c')
+        table.clear()
+        table['d'] = 5
+        self.assertEqual(table.keyAt(0), 'd')
+        self.assertRaises(IndexError, table.keyAt, 1)
+
+    def test_arrays_setter(self):
+        pressure = SolutionStorage.ArrayInfo(numpy.zeros(4))
+        velocity = SolutionStorage.ArrayInfo(numpy.zeros((4, 3)))
+
+        # Plain dict is ordered by name
+        storage = SolutionStorage({'velocity': velocity, 'pressure': pressure})
+        self.assertListEqual([storage.getArrayName(i) for i in xrange(storage.getNArrays())], ['pressure', 'velocity'])
+
+        # OrderedDict keeps its order, but is copied
+        arrays = OrderedDict([('velocity', velocity), ('pressure', pressure)])
+        storage.arrays = arrays
+        self.assertListEqual([storage.getArrayName(i) for i in xrange(storage.getNArrays())], ['velocity', 'pressure'])
+        self.assertIsNot(storage.arrays, arrays)
+        del arrays['pressure']
+        self.assertEqual(storage.getNArrays(), 2)
+
+        # The arrays added through the storage are indexed
+        storage.arrays['displacement'] = SolutionStorage.ArrayInfo(numpy.zeros((4, 3)))
+        self.assertEqual(storage.getArrayName(2), 'displacement')
+        self.assertEqual(storage.getArrayNComponents(2), 3)
+        del storage.arrays['velocity']
+        self.assertEqual(storage.getArrayName(1), 'displacement')
+
+        # _ArrayTable is not copied
+        table = _ArrayTable([('pressure', pressure)])
+        storage.arrays = table
+        self.assertIs(storage.arrays, table)
+
+    def test_contiguous_data(self):
+        data = numpy.arange(12.0).reshape(3, 4)
+
+        arrayInfo = SolutionStorage.ArrayInfo(data)
+        self.assertIs(arrayInfo.getContiguousData(), data)
+
+        # Transposed view is copied once and the copy replaces the data
+        arrayInfo = SolutionStorage.ArrayInfo(data.transpose())
+        contiguousData = arrayInfo.getContiguousData()
+        self.assertTrue(contiguousData.flags['C_CONTIGUOUS'])
+        self.assertTrue(numpy.array_equal(contiguousData, data.transpose()))
+        self.assertIs(arrayInfo.data, contiguousData)
+        self.assertIs(arrayInfo.getContiguousData(), contiguousData)
+
+        # Data in the non-native byte order is converted
+        arrayInfo = SolutionStorage.ArrayInfo(data.astype(data.dtype.newbyteorder('S')))
+        contiguousData = arrayInfo.getContiguousData()
+        self.assertTrue(contiguousData.dtype.isnative)
+        self.assertTrue(numpy.array_equal(contiguousData, data))
+
+    def test_array_data(self):
+        storage = SolutionStorage()
+        data = numpy.arange(12.0).reshape(4, 3)
+        storage.arrays['velocity'] = SolutionStorage.ArrayInfo(data.transpose())
+        storage.arrays['pressure'] = SolutionStorage.ArrayInfo(numpy.arange(4, dtype=numpy.float32))
+
+        self.assertEqual(str(storage.getArrayData(0)), data.transpose().tobytes())
+        self.assertEqual(str(storage.getArrayData(1)), numpy.arange(4.0).tobytes())
+
+        # The data is not kept by the storage, the changes made to the data are exported
+        storage.arrays['velocity'].data[0, 0] = -1
+        self.assertEqual(str(storage.getArrayData(0)), storage.arrays['velocity'].data.tobytes())
+        self.assertEqual(storage.getArrayMemoryUsage(0), data.nbytes)
+
+    def test_reduced_precision(self):
+        data = numpy.linspace(0, 1, 12).reshape(4, 3)
+        storage = SolutionStorage()
+        storage.arrays['velocity'] = SolutionStorage.ArrayInfo(data.astype(numpy.float32))
+        storage.arrays['custom_error_indicator'] = SolutionStorage.ArrayInfo(data[:, 0].astype(numpy.float16))
+        storage.arrays['indices'] = SolutionStorage.ArrayInfo(numpy.arange(4, dtype=numpy.int32))
+
+        # The reduced-precision data is exported as double precision
+        self.assertEqual(storage.getArrayDataType(0), ArrayDataType.Double)
+        self.assertEqual(storage.getArrayDataType(1), ArrayDataType.Double)
+        self.assertEqual(storage.getArrayDataType(2), ArrayDataType.Int)
+        velocity = numpy.frombuffer(storage.getArrayBuffer(0), dtype=numpy.float64)
+        self.assertTrue(numpy.allclose(velocity, data.ravel(), rtol=1e-6))
+        indicator = numpy.frombuffer(str(storage.getArrayData(1)), dtype=numpy.float64)
+        self.assertTrue(numpy.allclose(indicator, data[:, 0], rtol=1e-3))
+
+        # The exported double-precision data is not kept
+        self.assertEqual(storage.arrays['velocity'].data.dtype, numpy.float32)
+        self.assertEqual(storage.getArrayMemoryUsage(0), data.nbytes / 2)
+        self.assertEqual(storage.getArrayMemoryUsage(1), data.shape[0] * 2)
+
+        with self.assertRaises(AssertionError):
+            SolutionStorage.ArrayInfo(data.astype(numpy.int64))
+
+    def test_memory_usage(self):
+        block = numpy.arange(400.0).reshape(100, 4)
+        indices = numpy.arange(100, dtype=numpy.int32)
+
+        storage = SolutionStorage()
+        storage.arrays['pressure'] = SolutionStorage.ArrayInfo(block[:, 0])
+        storage.arrays['velocity'] = SolutionStorage.ArrayInfo(block[:, 1:4])
+        storage.arrays['indices'] = SolutionStorage.ArrayInfo(indices)
+        storage.arrays['lazy'] = SolutionStorage.ArrayInfo(_Source(numpy.ones((100, 3))))
+
+        # The fields of the same block report the whole block, which is counted once in total
+        self.assertEqual(storage.getArrayMemoryUsage(0), block.nbytes)
+        self.assertEqual(storage.getArrayMemoryUsage(1), block.nbytes)
+        self.assertEqual(storage.getArrayMemoryUsage(2), indices.nbytes)
+        self.assertEqual(storage.getArrayMemoryUsage(3), 0)
+        self.assertEqual(storage.getMemoryUsage(), block.nbytes + indices.nbytes)
+
+        # The contiguous copy no longer refers to the block
+        velocity = storage.arrays['velocity'].getContiguousData()
+        self.assertEqual(storage.getArrayMemoryUsage(1), velocity.nbytes)
+        self.assertEqual(storage.getMemoryUsage(), block.nbytes + velocity.nbytes + indices.nbytes)
+
+        storage.loadArrays()
+        self.assertEqual(storage.getArrayMemoryUsage(3), 100 * 3 * 8)
+        self.assertEqual(storage.getMemoryUsage(), block.nbytes + velocity.nbytes + indices.nbytes + 100 * 3 * 8)
+
+        # Memory-mapped data is not counted
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'data')
+            block.tofile(fileName)
+            mappedBlock = numpy.memmap(fileName, dtype=block.dtype, mode='r', shape=block.shape)
+            storage.arrays['pressure'].data = mappedBlock[:, 0]
+            self.assertEqual(storage.getArrayMemoryUsage(0), 0)
+            del mappedBlock
+            storage.arrays.clear()
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_changed_source(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'restart.0.1')
+            shutil.copy(r'testData\restart.1300.0', fileName)
+            with open(fileName, 'rb') as inFile:
+                fields = readPhastaFile(PhastaRawFileReader(inFile), restartConfig)
+            sources = createPhastaFieldSources(fileName, restartConfig)
+
+            storage = SolutionStorage()
+            for name in ['pressure', 'velocity']:
+                storage.arrays[name] = SolutionStorage.ArrayInfo(sources[name])
+            storage.getArrayBuffer(0)
+
+            # The file changed since the sources were created cannot be loaded, the array is filled with NaNs
+            patchPhastaFile(fileName, restartConfig, {'velocity': fields['velocity'] * 2})
+            os.utime(fileName, (0, 0))
+            self.assertEqual(len(storage.getArrayBuffer(1)), fields['velocity'].nbytes)
+            self.assertTrue(numpy.isnan(storage.arrays['velocity'].data).all())
+            self.assertTrue(numpy.array_equal(storage.arrays['pressure'].data, fields['pressure'].transpose()))
+        finally:
+            shutil.rmtree(tempDir)
+
+
+if __name__ == '__main__':
+    unittest.main()